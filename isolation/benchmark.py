@@ -0,0 +1,319 @@
+"""Self-play benchmark harness for the heuristics in game_agent.py.
+
+Plays a round robin of games between several `CustomPlayer` configurations
+on a process pool and writes the results to a JSON file, e.g.
+
+    python benchmark.py --games 1000 --time-limit 150 --output results.json
+
+Every game is seeded, so a run can be reproduced exactly given the same
+settings. For each configuration the report contains the win rate with a
+95% (Wilson) confidence interval, the average depth reached by iterative
+deepening, the number of searched nodes per second and the number of games
+lost by a timeout forfeit. The CPU time used per move (including helper
+processes of root-parallel MCTS) allows comparing playing strength per
+CPU-second between engines that use a different number of cores.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import time
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
+from isolation import Board
+
+import game_agent
+
+
+# Configurations that can be selected by name on the command line. Score
+# functions are referenced by name so the tasks can be sent to the workers.
+# There is no pondering configuration: both players of a game run in the same
+# process, so a pondering thread would take its search time from the opponent
+# through the interpreter lock instead of using idle time.
+CONFIGS = {
+    'custom': {'score_fn': 'custom_score', 'method': 'alphabeta'},
+    'center': {'score_fn': 'h_distance_center', 'method': 'alphabeta'},
+    'distance': {'score_fn': 'h_distances_between', 'method': 'alphabeta'},
+    'closest_center': {'score_fn': 'h_closest_center_move', 'method': 'alphabeta'},
+    'custom_minimax': {'score_fn': 'custom_score', 'method': 'minimax'},
+    'custom_adaptive': {'score_fn': 'custom_score', 'method': 'alphabeta', 'adaptive_time': True},
+    'custom_cached': {'score_fn': 'custom_score', 'method': 'alphabeta', 'cache_size': 2**16},
+    'custom_batch': {'score_fn': 'custom_score', 'method': 'alphabeta',
+                     'batch_score_fn': 'custom_score_batch'},
+    'mcts': {'method': 'mcts'},
+    'mcts_parallel': {'method': 'mcts', 'mcts_workers': 4},
+}
+
+# Configurations compared when none are given. Root-parallel MCTS is left out:
+# its helper processes need cores of their own besides the pool that plays
+# the games, and without them it loses most games on time.
+DEFAULT_CONFIGS = sorted(name for name in CONFIGS if name != 'mcts_parallel')
+
+TIME_LIMIT = 150
+TIMEOUT = 10.
+
+
+def make_player(config, timeout=TIMEOUT, seed=None):
+    """Create a `CustomPlayer` from a configuration dictionary.
+
+    Parameters
+    ----------
+    config : dict
+        Keyword arguments for `CustomPlayer`; `score_fn` and `batch_score_fn`
+        are given as the name of a function in game_agent.py or as a
+        picklable callable such as a `WeightedScore`. An optional
+        `cache_size` wraps the score function in an `EvaluationCache` of
+        that size.
+
+    timeout : float
+        Timer threshold (in milliseconds) of the player.
+
+    seed : int (optional)
+        Seed of the player's own random number generator (used by MCTS).
+
+    Returns
+    -------
+    `game_agent.CustomPlayer`
+    """
+    kwargs = dict(config)
+    for key in ('score_fn', 'batch_score_fn'):
+        if isinstance(kwargs.get(key), str):
+            kwargs[key] = getattr(game_agent, kwargs[key])
+    cache_size = kwargs.pop('cache_size', None)
+    if cache_size:
+        kwargs['score_fn'] = game_agent.EvaluationCache(kwargs['score_fn'], cache_size)
+    kwargs.setdefault('timeout', timeout)
+    kwargs.setdefault('seed', seed)
+    kwargs['collect_stats'] = True
+    return game_agent.CustomPlayer(**kwargs)
+
+
+def play_game(task):
+    """Play a single seeded game and collect search statistics per player.
+
+    The first two moves are random (drawn from the game seed) so that games
+    between the same two configurations do not all follow the same line.
+
+    Parameters
+    ----------
+    task : tuple
+        (seed, name_1, config_1, name_2, config_2, time_limit, timeout) where
+        player 1 moves first.
+
+    Returns
+    -------
+    dict
+        The winner's name, the outcome and per-player totals of moves, search
+        depth, nodes, search time and CPU time (in seconds).
+    """
+    seed, name_1, config_1, name_2, config_2, time_limit, timeout = task
+    random.seed(seed)
+
+    player_1 = make_player(config_1, timeout, random.getrandbits(32))
+    player_2 = make_player(config_2, timeout, random.getrandbits(32))
+    names = {player_1: name_1, player_2: name_2}
+    totals = {name: {'moves': 0, 'depth': 0, 'nodes': 0, 'time': 0., 'cpu_time': 0.}
+              for name in (name_1, name_2)}
+
+    game = Board(player_1, player_2)
+    for _ in range(2):
+        game.apply_move(random.choice(game.get_legal_moves()))
+
+    clock = timeit.default_timer
+    while True:
+        player = game.active_player
+        legal_moves = game.get_legal_moves()
+        if not legal_moves:
+            outcome = 'no moves'
+            winner = game.inactive_player
+            break
+
+        cpu_start = time.process_time()
+        move_start = clock()
+        time_left = lambda: time_limit - 1000 * (clock() - move_start)
+        move = player.get_move(game.copy(), legal_moves, time_left)
+        elapsed = clock() - move_start
+        cpu_time = time.process_time() - cpu_start + player.stats.worker_time
+
+        stats = totals[names[player]]
+        stats['moves'] += 1
+        stats['depth'] += player.stats.depth_completed
+        stats['nodes'] += player.stats.nodes
+        stats['time'] += elapsed
+        stats['cpu_time'] += cpu_time
+
+        if 1000 * elapsed > time_limit:
+            outcome = 'timeout'
+            winner = game.inactive_player
+            break
+        if move not in legal_moves:
+            outcome = 'illegal move'
+            winner = game.inactive_player
+            break
+        game.apply_move(move)
+
+    for player in (player_1, player_2):
+        player.close()
+
+    return {'winner': names[winner], 'loser': names[game.get_opponent(winner)],
+            'outcome': outcome, 'stats': totals}
+
+
+def wilson_interval(wins, games, z=1.96):
+    """Return the Wilson score confidence interval of a win rate.
+
+    Parameters
+    ----------
+    wins : int
+    games : int
+    z : float
+        Quantile of the normal distribution; 1.96 gives a 95% interval.
+
+    Returns
+    -------
+    (float, float)
+        Lower and upper bound of the interval.
+    """
+    if games == 0:
+        return 0., 1.
+    p = wins / games
+    denominator = 1 + z * z / games
+    center = (p + z * z / (2 * games)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denominator
+    return max(0., center - margin), min(1., center + margin)
+
+
+def summarize(games):
+    """Aggregate finished games into one record per configuration.
+
+    Parameters
+    ----------
+    games : list<dict>
+        Results returned by `play_game`.
+
+    Returns
+    -------
+    dict
+        Maps each configuration name to its win rate, confidence interval,
+        average depth, nodes per second, CPU time per move and timeout
+        forfeits.
+    """
+    summary = {}
+    for result in games:
+        for name, stats in result['stats'].items():
+            record = summary.setdefault(name, {
+                'games': 0, 'wins': 0, 'timeouts': 0,
+                'moves': 0, 'depth': 0, 'nodes': 0, 'time': 0., 'cpu_time': 0.})
+            record['games'] += 1
+            for key in ('moves', 'depth', 'nodes', 'time', 'cpu_time'):
+                record[key] += stats[key]
+        summary[result['winner']]['wins'] += 1
+        if result['outcome'] == 'timeout':
+            summary[result['loser']]['timeouts'] += 1
+
+    for name, record in summary.items():
+        low, high = wilson_interval(record['wins'], record['games'])
+        record['win_rate'] = record['wins'] / record['games']
+        record['win_rate_ci'] = [low, high]
+        record['avg_depth'] = record['depth'] / max(record['moves'], 1)
+        record['nodes_per_sec'] = record['nodes'] / record['time'] if record['time'] else 0.
+        record['cpu_per_move'] = record['cpu_time'] / max(record['moves'], 1)
+    return summary
+
+
+def make_tasks(names, configs, num_games, time_limit, timeout, seed):
+    """Create the game tasks of a round robin between the configurations.
+
+    Every pairing plays `num_games` games, half of them with each side moving
+    first. Game seeds are derived from `seed` so the whole run is repeatable.
+    """
+    rng = random.Random(seed)
+    tasks = []
+    for name_1, name_2 in itertools.combinations(names, 2):
+        for ii in range(num_games):
+            first, second = (name_1, name_2) if ii % 2 == 0 else (name_2, name_1)
+            tasks.append((rng.getrandbits(32), first, configs[first],
+                          second, configs[second], time_limit, timeout))
+    return tasks
+
+
+def run(names, num_games=100, time_limit=TIME_LIMIT, timeout=TIMEOUT,
+        seed=0, processes=None, configs=CONFIGS):
+    """Run the round robin and return the JSON-serializable report.
+
+    Parameters
+    ----------
+    names : list<str>
+        Names of the configurations (keys of `configs`) to compare.
+
+    num_games : int
+        Number of games per pairing.
+
+    time_limit : float
+        Time per move in milliseconds.
+
+    timeout : float
+        Timer threshold of every player in milliseconds.
+
+    seed : int
+        Master seed for all games.
+
+    processes : int (optional)
+        Size of the process pool; defaults to the number of CPUs.
+
+    configs : dict
+        Table of available configurations.
+
+    Returns
+    -------
+    dict
+    """
+    tasks = make_tasks(names, configs, num_games, time_limit, timeout, seed)
+    # The workers must not be daemonic, root-parallel MCTS players start
+    # helper processes of their own
+    with ProcessPoolExecutor(processes) as executor:
+        games = list(executor.map(play_game, tasks, chunksize=4))
+
+    pairings = {}
+    for result in games:
+        key = ' vs '.join(sorted((result['winner'], result['loser'])))
+        pairings.setdefault(key, []).append(result)
+
+    return {
+        'settings': {'configs': {name: configs[name] for name in names},
+                     'games_per_pairing': num_games, 'time_limit': time_limit,
+                     'timeout': timeout, 'seed': seed},
+        'players': summarize(games),
+        'pairings': {key: summarize(results) for key, results in sorted(pairings.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('configs', nargs='*', default=DEFAULT_CONFIGS,
+                        help='configurations to compare: {}'.format(', '.join(sorted(CONFIGS))))
+    parser.add_argument('--games', type=int, default=100, help='games per pairing')
+    parser.add_argument('--time-limit', type=float, default=TIME_LIMIT, help='milliseconds per move')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help='timer threshold of the players')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args()
+
+    report = run(args.configs, args.games, args.time_limit, args.timeout,
+                 args.seed, args.processes)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for name, record in sorted(report['players'].items()):
+        print("{:>16}: {:6.1%} [{:.1%}, {:.1%}]  depth {:5.2f}  {:8.0f} nodes/s  "
+              "{:6.1f} ms CPU/move  {} timeouts".format(
+                  name, record['win_rate'], record['win_rate_ci'][0], record['win_rate_ci'][1],
+                  record['avg_depth'], record['nodes_per_sec'], 1000 * record['cpu_per_move'],
+                  record['timeouts']))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,15 @@ augment the test suite with your own test cases to further test your code.
 You must test your agent's strength against a set of agents with known
 relative strength using tournament.py and include the results in your report.
 """
+import json
 import random
+import threading
+import timeit
+from collections import namedtuple
+
+import numpy as np
+
+from mcts import MCTS
 
 
 class Timeout(Exception):
@@ -127,6 +135,10 @@ def h_closest_center_move(game,player):
     # Get all movement options of the enemy
     legal_enemy_moves = game.get_legal_moves(game.get_opponent(player))
 
+    # The enemy is stuck, which is as good as it gets
+    if not legal_enemy_moves:
+        return float("inf")
+
     # Calculate the distance of all reachable locations to the center, return the minimum
     return min( [ abs(move[0] - game_center[0]) + abs(move[1] - game_center[1]) for move in legal_enemy_moves] )
 
@@ -182,6 +194,736 @@ def custom_score(game, player):
 
 
 
+# Fewest children for which a batch score function is used. Below it the
+# NumPy overhead (about 140us per call) costs more than forecast_move and
+# scoring each child; custom_score breaks even at 6 to 7 children.
+BATCH_MIN_MOVES = 7
+
+# The eight knight moves
+KNIGHT_MOVES = np.array([(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                         (1, -2), (1, 2), (2, -1), (2, 1)])
+
+LeafFeatures = namedtuple('LeafFeatures', ['own', 'opp', 'own_moves', 'opp_moves', 'won', 'lost'])
+LeafFeatures.__doc__ = """Features of a batch of child positions, one row per child.
+
+    own, opp : (n, 2) arrays of the locations of the player and its opponent
+    own_moves, opp_moves : (n,) arrays with the number of legal moves of each
+    won, lost : (n,) boolean arrays of the terminal positions
+    """
+
+
+def blocked_cells(game):
+    """Return a boolean (height, width) array of the cells that are not blank.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        An instance of `isolation.Board` encoding the current state of the
+        game (e.g., player locations and blocked cells).
+    """
+    blocked = np.ones((game.height, game.width), dtype=bool)
+    blank = game.get_blank_spaces()
+    if blank:
+        rows, cols = zip(*blank)
+        blocked[rows, cols] = False
+    return blocked
+
+
+def knight_targets(locations, blocked, moves):
+    """Find the legal knight moves from a location on each child board.
+
+    Parameters
+    ----------
+    locations : (n, 2) array
+        One location per child.
+
+    blocked : (height, width) boolean array
+        The blocked cells of the parent board.
+
+    moves : (n, 2) array
+        The move leading to each child, which blocks one more cell.
+
+    Returns
+    -------
+    rows, cols, legal : (n, 8) arrays
+        The eight knight targets of each location and whether each of them
+        is a legal move.
+    """
+    height, width = blocked.shape
+    rows = locations[:, 0, None] + KNIGHT_MOVES[None, :, 0]
+    cols = locations[:, 1, None] + KNIGHT_MOVES[None, :, 1]
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    free = ~blocked[np.clip(rows, 0, height - 1), np.clip(cols, 0, width - 1)]
+    moved = (rows == moves[:, 0, None]) & (cols == moves[:, 1, None])
+    return rows, cols, inside & free & ~moved
+
+
+def count_moves(locations, blocked, moves):
+    """Count the legal knight moves from a location on each child board.
+
+    See `knight_targets` for the parameters.
+
+    Returns
+    -------
+    (n,) array
+    """
+    return knight_targets(locations, blocked, moves)[2].sum(axis=1)
+
+
+def leaf_features(game, player, moves):
+    """Compute the features of all children of a node in one vectorized pass.
+
+    The children are the positions after the active player makes each of
+    the given moves; they are never created as `Board` objects.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        The parent position.
+
+    player : object
+        The player from whose point of view the features are computed.
+
+    moves : list<(int, int)>
+        Legal moves of the active player in `game`.
+
+    Returns
+    -------
+    LeafFeatures or None
+        None if a player has not been placed on the board yet, in which case
+        the caller has to fall back to scoring the children one by one.
+    """
+    mover = game.active_player
+    opponent = game.get_opponent(player)
+    own_location = game.get_player_location(player)
+    opp_location = game.get_player_location(opponent)
+    if own_location is None or opp_location is None:
+        return None
+
+    moves = np.array(moves)
+    n = len(moves)
+    blocked = blocked_cells(game)
+
+    if mover == player:
+        own, opp = moves, np.repeat(np.array([opp_location]), n, axis=0)
+    else:
+        own, opp = np.repeat(np.array([own_location]), n, axis=0), moves
+    own_moves = count_moves(own, blocked, moves)
+    opp_moves = count_moves(opp, blocked, moves)
+
+    # In the children it is the other player's turn
+    if mover == player:
+        won, lost = opp_moves == 0, np.zeros(n, dtype=bool)
+    else:
+        won, lost = np.zeros(n, dtype=bool), own_moves == 0
+    return LeafFeatures(own, opp, own_moves, opp_moves, won, lost)
+
+
+def _center_distance(game, locations):
+    """Manhattan distance to the center as used by the scalar heuristics."""
+    return np.abs(locations[:, 0] - game.width / 2) + np.abs(locations[:, 1] - game.height / 2)
+
+
+def _terminal_scores(features, scores):
+    """Overwrite the scores of won and lost children with +/- infinity."""
+    scores[features.won] = float("inf")
+    scores[features.lost] = float("-inf")
+    return scores
+
+
+def h_distance_center_batch(game, player, moves):
+    """Vectorized version of `h_distance_center` for all children of a node.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        The parent position.
+
+    player : object
+        The player from whose point of view the children are scored.
+
+    moves : list<(int, int)>
+        Legal moves of the active player in `game`.
+
+    Returns
+    -------
+    list<float> or None
+        The score of each child in the order of `moves`; None if the batch
+        cannot be evaluated (see `leaf_features`).
+    """
+    features = leaf_features(game, player, moves)
+    if features is None:
+        return None
+    distance = _center_distance(game, features.own)
+    with np.errstate(divide='ignore'):
+        scores = np.where(distance == 0, float("inf"), 1.0 / distance)
+    return _terminal_scores(features, scores).tolist()
+
+
+def custom_score_batch(game, player, moves):
+    """Vectorized version of `custom_score` for all children of a node.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        The parent position.
+
+    player : object
+        The player from whose point of view the children are scored.
+
+    moves : list<(int, int)>
+        Legal moves of the active player in `game`.
+
+    Returns
+    -------
+    list<float> or None
+        The score of each child in the order of `moves`; None if the batch
+        cannot be evaluated (see `leaf_features`).
+    """
+    k = 5.0
+
+    features = leaf_features(game, player, moves)
+    if features is None:
+        return None
+    distance = _center_distance(game, features.own)
+    with np.errstate(divide='ignore'):
+        scores = np.where(distance == 0, float("inf"),
+                          k * 1.0 / distance + (1.0 / k) * features.own_moves)
+    return _terminal_scores(features, scores).tolist()
+
+
+# Features of `WeightedScore`, in the order of its weights
+FEATURES = ('center', 'own_moves', 'opp_moves', 'opp_distance', 'opp_center_move')
+
+
+def score_features(game, player):
+    """Compute the features combined by `WeightedScore` for a non-terminal
+    position.
+
+    center
+        Inverse distance of the player to the center, as in `custom_score`
+        (but 2 instead of infinity on the center itself).
+    own_moves, opp_moves
+        Number of legal moves of the player and of its opponent.
+    opp_distance
+        Inverse distance between the players, as in `h_distances_between`.
+    opp_center_move
+        Distance to the center of the opponent's legal move closest to it;
+        width + height if the opponent cannot move. Unlike
+        `h_closest_center_move` this uses the actual center of the board.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        An instance of `isolation.Board` encoding the current state of the
+        game (e.g., player locations and blocked cells).
+
+    player : object
+        A player instance in the current game.
+
+    Returns
+    -------
+    list<float>
+        The features in the order of `FEATURES`; only the mobility of the
+        player if the opponent has not been placed yet.
+    """
+    own = game.get_player_location(player)
+    opp = game.get_player_location(game.get_opponent(player))
+    own_moves = len(game.get_legal_moves(player))
+    if own is None or opp is None:
+        return [0., own_moves, 0., 0., 0.]
+
+    center_x, center_y = game.width / 2, game.height / 2
+    distance = abs(own[0] - center_x) + abs(own[1] - center_y)
+    center = 1.0 / distance if distance else 2.0
+
+    opp_legal = game.get_legal_moves(game.get_opponent(player))
+    opp_center_move = min([abs(move[0] - center_x) + abs(move[1] - center_y) for move in opp_legal],
+                          default=game.width + game.height)
+
+    return [center, own_moves, len(opp_legal),
+            1.0 / (abs(own[0] - opp[0]) + abs(own[1] - opp[1])), opp_center_move]
+
+
+def batch_score_features(game, player, moves):
+    """Vectorized `score_features` for all children of a node.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        The parent position.
+
+    player : object
+        The player from whose point of view the features are computed.
+
+    moves : list<(int, int)>
+        Legal moves of the active player in `game`.
+
+    Returns
+    -------
+    ((n, len(FEATURES)) array, LeafFeatures) or None
+        The feature matrix and the leaf features it was computed from; None
+        if a player has not been placed yet.
+    """
+    features = leaf_features(game, player, moves)
+    if features is None:
+        return None
+
+    distance = _center_distance(game, features.own)
+    with np.errstate(divide='ignore'):
+        center = np.where(distance == 0, 2.0, 1.0 / distance)
+
+    rows, cols, legal = knight_targets(features.opp, blocked_cells(game), np.array(moves))
+    target_distance = np.abs(rows - game.width / 2) + np.abs(cols - game.height / 2)
+    opp_center_move = np.where(legal, target_distance, np.inf).min(axis=1)
+    opp_center_move[~legal.any(axis=1)] = game.width + game.height
+
+    opp_distance = 1.0 / np.abs(features.own - features.opp).sum(axis=1)
+    matrix = np.column_stack([center, features.own_moves, features.opp_moves,
+                              opp_distance, opp_center_move])
+    return matrix, features
+
+
+class WeightedScore:
+    """A heuristic defined as a weighted sum of the `FEATURES`, e.g. as fitted
+    by tuning.py.
+
+    Instances can be passed as score_fn to `CustomPlayer`; their `batch`
+    method can be passed as batch_score_fn. For example, the weights
+    (5, 0.2, 0, 0, 0) reproduce `custom_score`.
+
+    Parameters
+    ----------
+    weights : list<float>
+        One weight per feature, in the order of `FEATURES`.
+    """
+
+    def __init__(self, weights):
+        if len(weights) != len(FEATURES):
+            raise ValueError('Expected {} weights, got {}'.format(len(FEATURES), len(weights)))
+        self.weights = [float(w) for w in weights]
+
+    def __call__(self, game, player):
+        if game.is_loser(player):
+            return float("-inf")
+
+        if game.is_winner(player):
+            return float("inf")
+
+        return sum(w * f for w, f in zip(self.weights, score_features(game, player)))
+
+    def batch(self, game, player, moves):
+        """Score all children of a node at once (see `custom_score_batch`)."""
+        result = batch_score_features(game, player, moves)
+        if result is None:
+            return None
+        matrix, features = result
+        return _terminal_scores(features, matrix.dot(np.array(self.weights))).tolist()
+
+    def save(self, path):
+        """Write the weights to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump({'features': FEATURES, 'weights': self.weights}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Read a heuristic written by `save`."""
+        with open(path) as f:
+            data = json.load(f)
+        if tuple(data['features']) != FEATURES:
+            raise ValueError('Unknown features {}'.format(data['features']))
+        return cls(data['weights'])
+
+    def __repr__(self):
+        return 'WeightedScore({})'.format(self.weights)
+
+
+def position_key(game, player):
+    """Return a compact key of a game state as seen by the given player.
+
+    The key combines the hash of the blocked cells with both player
+    locations and whose turn it is, which is everything the heuristics in
+    this module depend on.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        An instance of `isolation.Board` encoding the current state of the
+        game (e.g., player locations and blocked cells).
+
+    player : object
+        A player instance in the current game.
+
+    Returns
+    -------
+    tuple
+        A hashable key for the position.
+    """
+    return (game.hash(), game.get_player_location(player),
+            game.get_player_location(game.get_opponent(player)),
+            game.active_player == player)
+
+
+class EvaluationCache:
+    """Score function wrapper that remembers evaluations in a fixed-size
+    hash table, so positions scored again by a later iteration of iterative
+    deepening are not evaluated twice.
+
+    Each position maps to a single slot of the table (indexed by the hash of
+    its `position_key`); a new position always replaces the old entry of
+    its slot, which keeps the memory bounded without any bookkeeping.
+
+    Parameters
+    ----------
+    score_fn : callable
+        The heuristic to wrap, e.g. `custom_score`.
+
+    size : int (optional)
+        Number of slots; rounded up to the next power of two.
+
+    Example
+    -------
+        player = CustomPlayer(score_fn=EvaluationCache(custom_score))
+    """
+
+    def __init__(self, score_fn, size=2**16):
+        self.score_fn = score_fn
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self.mask = self.size - 1
+        self.clear()
+
+    def __call__(self, game, player):
+        key = position_key(game, player)
+        slot = hash(key) & self.mask
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.values[slot]
+
+        self.misses += 1
+        value = self.score_fn(game, player)
+        self.keys[slot] = key
+        self.values[slot] = value
+        return value
+
+    def clear(self):
+        """Remove all entries and reset the hit and miss counters."""
+        self.keys = [None] * self.size
+        self.values = [0.] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that were answered from the table."""
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.
+
+
+class SearchStats:
+    """Statistics of the search performed by a single call to
+    `CustomPlayer.get_move()`.
+
+    Attributes
+    ----------
+    nodes : int
+        Number of nodes visited by minimax or alphabeta.
+
+    expanded : int
+        Number of visited nodes whose children were generated.
+
+    generated : int
+        Number of children generated at the expanded nodes.
+
+    leaf_evaluations : int
+        Number of calls to the score function.
+
+    cutoffs : dict<int, int>
+        Number of alpha-beta cutoffs indexed by ply (distance from the root).
+
+    depth_completed : int
+        Deepest search that finished before the timeout.
+
+    iteration_times : list<float>
+        Time (in milliseconds) spent on each completed search iteration.
+
+    time_remaining : float
+        Milliseconds left on the clock when the move was returned; compare
+        with `CustomPlayer.TIMER_THRESHOLD` to see how close the search came
+        to timing out.
+
+    timed_out : bool
+        True if the last search iteration was aborted by a timeout.
+
+    tt_probes, tt_hits : int
+        Lookups in and hits of the evaluation cache during this move.
+
+    ponder_hit : bool
+        True if the search continued from the result of pondering.
+
+    worker_time : float
+        CPU seconds used by helper processes (root-parallel MCTS).
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.expanded = 0
+        self.generated = 0
+        self.leaf_evaluations = 0
+        self.cutoffs = {}
+        self.depth_completed = 0
+        self.iteration_times = []
+        self.time_remaining = None
+        self.timed_out = False
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.ponder_hit = False
+        self.worker_time = 0.
+
+    @property
+    def branching_factor(self):
+        """Average number of children of an expanded node."""
+        if not self.expanded:
+            return 0.
+        return self.generated / self.expanded
+
+    @property
+    def tt_hit_rate(self):
+        """Fraction of evaluation cache lookups that were hits."""
+        if not self.tt_probes:
+            return 0.
+        return self.tt_hits / self.tt_probes
+
+    def cutoff(self, ply):
+        """Count an alpha-beta cutoff at the given ply."""
+        self.cutoffs[ply] = self.cutoffs.get(ply, 0) + 1
+
+    def as_dict(self):
+        """Return the statistics as a JSON-serializable dictionary."""
+        record = dict(self.__dict__)
+        record['cutoffs'] = {str(ply): count for ply, count in self.cutoffs.items()}
+        record['branching_factor'] = self.branching_factor
+        record['tt_hit_rate'] = self.tt_hit_rate
+        return record
+
+
+class TimeManager:
+    """Decides before every iteration of iterative deepening whether the
+    next, deeper search is worth starting.
+
+    The cost of the next iteration is predicted from the times of the
+    previous iterations: the ratio between the last two iteration times is
+    the observed (time) branching factor. An iteration that cannot finish
+    before the timer threshold is skipped instead of being started and
+    thrown away by the `Timeout`.
+
+    Normally the search stops after a fraction `soft_limit` of the time
+    available for the move. If the best move changed in the last iteration
+    the position is considered unstable and the search may use all of its
+    time, while a best move that stayed the same for `stable_iterations`
+    iterations ends the search after half of the soft limit.
+
+    Parameters
+    ----------
+    threshold : float
+        Time (in milliseconds) that must be left when an iteration ends,
+        i.e. the `TIMER_THRESHOLD` of the player.
+
+    soft_limit : float (optional)
+        Fraction of the available time used for stable positions.
+
+    stable_iterations : int (optional)
+        Number of iterations with the same best move after which the search
+        is considered settled.
+
+    min_branching : float (optional)
+        Lower bound of the branching factor used for predictions; the very
+        first iterations are too fast to be timed reliably.
+    """
+
+    def __init__(self, threshold, soft_limit=0.5, stable_iterations=4,
+                 min_branching=2.):
+        self.threshold = threshold
+        self.soft_limit = soft_limit
+        self.stable_iterations = stable_iterations
+        self.min_branching = min_branching
+        self.start(lambda: 0.)
+
+    def start(self, time_left):
+        """Reset the manager at the beginning of a move.
+
+        Parameters
+        ----------
+        time_left : callable
+            The timer of the current move (see `CustomPlayer.get_move()`).
+        """
+        self.time_left = time_left
+        self.budget = time_left() - self.threshold
+        self.iteration_times = []
+        self.best_move = None
+        self.stable = 0
+        self.last_start = self.budget
+
+    def begin_iteration(self):
+        """Mark the start of an iteration so that its duration can be measured."""
+        self.last_start = self.time_left()
+
+    def end_iteration(self, best_move):
+        """Record the duration and the result of a completed iteration.
+
+        Parameters
+        ----------
+        best_move : (int, int)
+            The best move found by the completed iteration.
+        """
+        self.iteration_times.append(self.last_start - self.time_left())
+        if best_move == self.best_move:
+            self.stable += 1
+        else:
+            self.stable = 0
+        self.best_move = best_move
+
+    def predict(self):
+        """Predict the duration (in milliseconds) of the next iteration."""
+        if not self.iteration_times:
+            return 0.
+        last = self.iteration_times[-1]
+        branching = self.min_branching
+        if len(self.iteration_times) > 1 and self.iteration_times[-2] > 0:
+            branching = max(branching, last / self.iteration_times[-2])
+        return last * branching
+
+    def should_continue(self):
+        """Return True if the next iteration should be started."""
+        remaining = self.time_left() - self.threshold
+        predicted = self.predict()
+        if predicted > remaining:
+            return False
+
+        elapsed = self.budget - remaining
+        if self.stable == 0 and self.iteration_times:
+            # The best move just changed, spend as much time as we have
+            return True
+        limit = self.soft_limit * self.budget
+        if self.stable >= self.stable_iterations:
+            limit = limit / 2
+        return elapsed + predicted <= limit
+
+
+class Ponderer:
+    """Keeps searching on the opponent's time in a background thread.
+
+    After the player has chosen a move, the ponderer first predicts the
+    opponent's reply with a shallow search and then runs iterative deepening
+    on the position after that reply. If the opponent actually plays the
+    predicted move, `get_move()` continues from the deepest completed
+    iteration instead of starting at depth one; in any case the evaluation
+    cache of the player has been filled with the positions searched.
+
+    Note that Python threads share one interpreter lock: pondering only
+    gains search time if the opponent does not run in the same process.
+
+    Parameters
+    ----------
+    player : `CustomPlayer`
+        The player to ponder for; its search methods are used.
+
+    predict_depth : int (optional)
+        Depth of the search that predicts the opponent's reply.
+
+    time_limit : float (optional)
+        Milliseconds after which pondering stops on its own, e.g. when the
+        game is over and `get_move()` is not called again.
+    """
+
+    def __init__(self, player, predict_depth=3, time_limit=10000.):
+        self.player = player
+        self.predict_depth = predict_depth
+        self.time_limit = time_limit
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.started = 0.
+        self.prediction = None
+        self.result = None
+
+    def start(self, game):
+        """Start pondering on the given position, where the opponent is to move.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            The position after the player's own move.
+        """
+        self.stop()
+        self.stop_event.clear()
+        self.prediction = None
+        self.result = None
+        self.started = timeit.default_timer()
+        self.thread = threading.Thread(target=self._run, args=(game,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Cancel the background search and wait for it to finish."""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def take(self, game):
+        """Stop pondering and return its result if the prediction was right.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            The position the player has to move in now.
+
+        Returns
+        -------
+        (int, float, (int, int)) or None
+            Depth, score and best move of the deepest iteration completed
+            while pondering, or None if the opponent played another move.
+        """
+        self.stop()
+        if self.prediction is None or self.prediction != position_key(game, self.player):
+            return None
+        return self.result
+
+    def time_left(self):
+        """Timer of the background search; expires as soon as it is stopped."""
+        if self.stop_event.is_set():
+            return float("-inf")
+        return self.time_limit - 1000 * (timeit.default_timer() - self.started)
+
+    def _run(self, game):
+        # The search state of the player belongs to the background search
+        # until get_move() stops it; player.stats, the statistics of the
+        # move just played, is left alone for the caller
+        player = self.player
+        player.time_left = self.time_left
+        player.search_stats = None
+        search = player.minimax if player.method == 'minimax' else player.alphabeta
+
+        try:
+            # The opponent moves first, which is a minimizing layer for us
+            reply = None
+            for depth in range(1, self.predict_depth + 1):
+                player.root_depth = depth
+                _, reply = search(game, depth, maximizing_player=False)
+            if reply is None or reply == (-1, -1):
+                return
+
+            position = game.forecast_move(reply)
+            self.prediction = position_key(position, player)
+            depth = 1
+            while depth <= len(position.get_blank_spaces()):
+                player.root_depth = depth
+                score, move = search(position, depth)
+                self.result = (depth, score, move)
+                depth = depth + 1
+        except Timeout:
+            pass
+
+
 class CustomPlayer:
     """Game-playing agent that chooses a move using your evaluation function
     and a depth-limited minimax algorithm with alpha-beta pruning. You must
@@ -197,29 +939,82 @@ class CustomPlayer:
         current state.)
 
     score_fn : callable (optional)
-        A function to use for heuristic evaluation of game states.
+        A function to use for heuristic evaluation of game states. Wrap it in
+        an `EvaluationCache` to reuse evaluations across iterations.
+
+    batch_score_fn : callable (optional)
+        A vectorized version of score_fn (e.g. `custom_score_batch`) that
+        scores all children of a node at once, called as
+        batch_score_fn(game, player, moves). Used at depth one when given,
+        for nodes with at least BATCH_MIN_MOVES children.
 
     iterative : boolean (optional)
         Flag indicating whether to perform fixed-depth search (False) or
         iterative deepening search (True).
 
-    method : {'minimax', 'alphabeta'} (optional)
-        The name of the search method to use in get_move().
+    method : {'minimax', 'alphabeta', 'mcts'} (optional)
+        The name of the search method to use in get_move(). Monte Carlo tree
+        search (see mcts.py) ignores score_fn and the search depth.
 
     timeout : float (optional)
         Time remaining (in milliseconds) when search is aborted. Should be a
         positive value large enough to allow the function to return before the
         timer expires.
+
+    adaptive_time : boolean (optional)
+        Flag indicating whether iterative deepening is controlled by a
+        `TimeManager` (True) or keeps deepening until the timeout (False).
+
+    collect_stats : boolean (optional)
+        Flag indicating whether to record a `SearchStats` instance for every
+        move in `self.stats`. Disabled by default, in which case the search
+        does no bookkeeping at all.
+
+    stats_callback : callable (optional)
+        A function called with the `SearchStats` of every move once the move
+        has been chosen. Implies collect_stats=True.
+
+    ponder : boolean (optional)
+        Flag indicating whether to keep searching in a background thread
+        while the opponent is thinking (see `Ponderer`). Only used with
+        iterative deepening. Call close() when the game is over.
+
+    mcts_workers : int (optional)
+        Number of trees searched in parallel processes by method='mcts'.
+
+    seed : int (optional)
+        Seed of the random number generator of method='mcts'; games are only
+        reproducible if it is given.
     """
 
     def __init__(self, search_depth=3, score_fn=custom_score,
-                 iterative=True, method='minimax', timeout=10.):
+                 iterative=True, method='minimax', timeout=10.,
+                 batch_score_fn=None,
+                 adaptive_time=False, collect_stats=False, stats_callback=None,
+                 ponder=False, mcts_workers=1, seed=None):
         self.search_depth = search_depth
         self.iterative = iterative
         self.score = score_fn
+        self.batch_score = batch_score_fn
         self.method = method
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
+        self.time_manager = TimeManager(timeout) if adaptive_time else None
+        self.collect_stats = collect_stats or stats_callback is not None
+        self.stats_callback = stats_callback
+        self.stats = None
+        # Statistics recorded by the running search: those of the current
+        # move, or None while pondering
+        self.search_stats = None
+        # Depth of the current search iteration, used to compute the ply of
+        # a node from its remaining depth
+        self.root_depth = search_depth
+        self.ponderer = None
+        if ponder and iterative and method != 'mcts':
+            self.ponderer = Ponderer(self)
+        self.mcts = None
+        if method == 'mcts':
+            self.mcts = MCTS(timeout, workers=mcts_workers, seed=seed)
 
     def get_move(self, game, legal_moves, time_left):
         """Search for the best move from the available legal moves and return a
@@ -257,18 +1052,27 @@ class CustomPlayer:
             (-1, -1) if there are no available legal moves.
         """
 
+        # Stop pondering first, it shares the search state of this player
+        ponder_result = None
+        if self.ponderer is not None:
+            ponder_result = self.ponderer.take(game)
+
         self.time_left = time_left
+        stats = self.stats = self.search_stats = SearchStats() if self.collect_stats else None
+        cache = self.score if isinstance(self.score, EvaluationCache) else None
+        if stats is not None and cache is not None:
+            hits, misses = cache.hits, cache.misses
 
         # Perform any required initializations, including selecting an initial
-        # move from the game board (i.e., an opening book), or returning
-        # immediately if there are no legal moves
+        # move from the game board (i.e., an opening book)
 
-        # If there is no legal move, forfeit
-        if not legal_moves:
-            return (-1,-1)
-        
-        # Save the first legal move, just in case of timeout
-        best_heuristic, best_move = float("-inf"), legal_moves[0]
+        # A forced move needs no search when we manage our time
+        time_manager = self.time_manager
+        forced = time_manager is not None and len(legal_moves) == 1
+
+        # Save the first legal move, just in case of timeout; without a legal
+        # move we forfeit, but still record the statistics below
+        best_heuristic, best_move = float("-inf"), legal_moves[0] if legal_moves else (-1,-1)
 
         try:
             # The search method call (alpha beta or minimax) should happen in
@@ -280,24 +1084,108 @@ class CustomPlayer:
             else:
                 search = self.alphabeta
 
-            if self.iterative:
+            if forced or not legal_moves:
+                # Nothing to search, the only legal move (or the forfeit) is
+                # returned below
+                pass
+            elif self.mcts is not None:
+                best_move = self.mcts.search(game, self, time_left, stats)
+            elif self.iterative:
                 depth = 1
-                while True:
+                # Continue where pondering left off if the opponent played
+                # the move we expected
+                if ponder_result is not None:
+                    depth, best_heuristic, best_move = ponder_result
+                    if stats is not None:
+                        stats.ponder_hit = True
+                        stats.depth_completed = depth
+                    depth = depth+1
+                if time_manager is not None:
+                    time_manager.start(time_left)
+                # There is no use in searching deeper than the number of
+                # moves left on the board
+                while depth <= len(game.get_blank_spaces()):
+                    if time_manager is not None:
+                        # Skip iterations that will not finish in time and
+                        # stop early once the best move has settled or the
+                        # outcome of the game is known
+                        if abs(best_heuristic) == float("inf") and depth > 1:
+                            break
+                        if not time_manager.should_continue():
+                            break
+                        time_manager.begin_iteration()
                     # Assume that deeper searches give better results
+                    start = time_left()
+                    self.root_depth = depth
                     best_heuristic, best_move = search(game,depth)
+                    if time_manager is not None:
+                        time_manager.end_iteration(best_move)
+                    if stats is not None:
+                        stats.depth_completed = depth
+                        stats.iteration_times.append(start - time_left())
                     depth = depth+1 
             else:
+                start = time_left()
+                self.root_depth = self.search_depth
                 best_heuristic, best_move = search(game, self.search_depth)
+                if stats is not None:
+                    stats.depth_completed = self.search_depth
+                    stats.iteration_times.append(start - time_left())
 
 
 
         except Timeout:
             # Handle any actions required at timeout, if necessary
-            pass
+            if stats is not None:
+                stats.timed_out = True
+
+        if stats is not None:
+            stats.time_remaining = time_left()
+            if cache is not None:
+                stats.tt_hits = cache.hits - hits
+                stats.tt_probes = stats.tt_hits + cache.misses - misses
+            if self.stats_callback is not None:
+                self.stats_callback(stats)
+
+        if self.ponderer is not None and best_move in legal_moves:
+            self.ponderer.start(game.forecast_move(best_move))
 
         # Return the best move from the last completed search iteration
         return best_move
 
+    def stop_pondering(self):
+        """Stop the background search started after the last move, if any."""
+        if self.ponderer is not None:
+            self.ponderer.stop()
+
+    def close(self):
+        """Stop pondering and shut down the helper processes of the player."""
+        self.stop_pondering()
+        if self.mcts is not None:
+            self.mcts.close()
+
+    def batch_scores(self, game, moves):
+        """Score all children of a node with the vectorized score function.
+
+        Parameters
+        ----------
+        game : isolation.Board
+            The parent node
+
+        moves : list<(int, int)>
+            The legal moves of the active player in `game`
+
+        Returns
+        -------
+        list<float> or None
+            The scores of the children in the order of `moves`, or None if
+            there is no batch score function, the node has fewer than
+            BATCH_MIN_MOVES children or it cannot be scored in a batch
+        """
+        if self.batch_score is None or len(moves) < BATCH_MIN_MOVES:
+            return None
+        return self.batch_score(game, self, moves)
+
     def minimax(self, game, depth, maximizing_player=True):
         """Implement the minimax search algorithm as described in the lectures.
 
@@ -334,17 +1222,32 @@ class CustomPlayer:
         if self.time_left() < self.TIMER_THRESHOLD:
             raise Timeout()
         
+        stats = self.search_stats
+        if stats is not None:
+            stats.nodes += 1
+
         # We reached a leaf node. This means that our agent either won or lost
         if not game.get_legal_moves(self):
             return game.utility(self), game.get_player_location(self)
 
+        if stats is not None:
+            children = len(game.get_legal_moves())
+            stats.expanded += 1
+            stats.generated += children
+            if depth == 1:
+                stats.leaf_evaluations += children
+
         # The base case only looks one move ahead and calls the score method for the resulting situations.
         # The extra tuple is added in case the minimizing player has no more movement options, so the min-function does not receive an empty list.
         if depth == 1:
+            legal_moves = game.get_legal_moves()
+            scores = self.batch_scores(game, legal_moves)
+            if scores is None:
+                scores = [ self.score(game.forecast_move(move),self) for move in legal_moves ]
             if maximizing_player:
-                return max( [ ( self.score(game.forecast_move(move),self),move ) for move in game.get_legal_moves() ] )
+                return max( list(zip(scores, legal_moves)) )
             else:
-                return min( [ ( self.score(game.forecast_move(move),self),move ) for move in game.get_legal_moves() ] + [ (float("inf"), (-1,-1)) ] )
+                return min( list(zip(scores, legal_moves)) + [ (float("inf"), (-1,-1)) ] )
         else:
             if maximizing_player:
                 return max( [ (self.minimax(game.forecast_move(move),depth-1,not maximizing_player)[0], move) for move in game.get_legal_moves() ] )  
@@ -399,21 +1302,42 @@ class CustomPlayer:
         # Get the legal moves of the current player
         legal_moves = game.get_legal_moves()
 
+        stats = self.search_stats
+        if stats is not None:
+            stats.nodes += 1
+
         # Leaf node, either we won or we lost
         if not game.get_legal_moves(self):
             return game.utility(self), game.get_player_location(self)
 
+        if stats is not None:
+            stats.expanded += 1
+            stats.generated += len(legal_moves)
+
         # The base case, only expand one step or the end of the game is reached and there is no use
         # in expanding beyond this point
         if depth == 1 or len(game.get_blank_spaces()) == 1:
+            # Score all children at once if there is a vectorized score
+            # function, otherwise they are scored one by one in the loop
+            scores = self.batch_scores(game, legal_moves)
+            if stats is not None and scores is not None:
+                stats.leaf_evaluations += len(legal_moves)
+
             if maximizing_player:
                 # The initial best move
                 best_score, best_move = float("-inf"), legal_moves[0]
-                for move in legal_moves:
+                for ii, move in enumerate(legal_moves):
                     # The value of this move can be calculated directly
-                    score = self.score(game.forecast_move(move),self)
+                    if scores is not None:
+                        score = scores[ii]
+                    else:
+                        score = self.score(game.forecast_move(move),self)
+                        if stats is not None:
+                            stats.leaf_evaluations += 1
                     # If we have crossed a threshold, this branch becomes irrelevant
                     if score >= beta:
+                        if stats is not None:
+                            stats.cutoff(self.root_depth - depth)
                         return score, move
                     else:
                         # And update the best move if we have found a better one
@@ -425,11 +1349,18 @@ class CustomPlayer:
             else:
                 # This time we are minimizing
                 worst_score, worst_move = float("inf"), (-1,-1)
-                for move in legal_moves:
+                for ii, move in enumerate(legal_moves):
                     # Again, calculate directly
-                    score = self.score(game.forecast_move(move),self)
+                    if scores is not None:
+                        score = scores[ii]
+                    else:
+                        score = self.score(game.forecast_move(move),self)
+                        if stats is not None:
+                            stats.leaf_evaluations += 1
                     # Check to see if we have crossed the line. If so, there is no use in continuing
                     if score <= alpha:
+                        if stats is not None:
+                            stats.cutoff(self.root_depth - depth)
                         return score, move
                     else:
                         # Update the new minimum score
@@ -445,6 +1376,8 @@ class CustomPlayer:
                     # The score cannot be calculated directy, but as the return value of the subtree search
                     score = self.alphabeta(game.forecast_move(move),depth-1,alpha,beta,not maximizing_player)[0]
                     if score >= beta:
+                        if stats is not None:
+                            stats.cutoff(self.root_depth - depth)
                         return score,move
                     else:
                         if score > best_score:
@@ -460,6 +1393,8 @@ class CustomPlayer:
                     # The score cannot be calculated directy, but as the return value of the subtree search
                     score = self.alphabeta(game.forecast_move(move),depth-1,alpha,beta,not maximizing_player)[0]
                     if score <= alpha:
+                        if stats is not None:
+                            stats.cutoff(self.root_depth - depth)
                         return score,move
                     else:
                         if score < worst_score:
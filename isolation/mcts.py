@@ -0,0 +1,368 @@
+"""Monte Carlo tree search for Isolation, used by `CustomPlayer` when it is
+created with method='mcts'.
+
+The search works on a bitboard copy of the game: cell (row, col) is bit
+row * width + col of an integer mask of the blank cells, and the knight
+moves of every cell are precomputed as masks as well. Playouts therefore
+never touch `isolation.Board` objects.
+
+Children are selected with UCT (upper confidence bounds applied to trees).
+The tree is kept between turns: if the opponent answers with a move that is
+already in the tree, its subtree becomes the new root. With more than one
+worker the search is root-parallel: every extra worker process grows an
+independent tree from the same root until the same deadline, and the visit
+counts of the root moves are summed up before the most visited move is
+played. Results that arrive too late are dropped, and the next search waits
+for them before it starts so that no worker runs into the next move.
+"""
+import math
+import random
+import time
+from multiprocessing import Pool, TimeoutError
+
+
+# Knight move masks per board size, see knight_masks()
+_KNIGHT_MASKS = {}
+
+
+def knight_masks(width, height):
+    """Return for each cell the mask of cells a knight can jump to.
+
+    Parameters
+    ----------
+    width, height : int
+        Size of the board.
+
+    Returns
+    -------
+    list<int>
+        Indexed by cell (row * width + col).
+    """
+    key = (width, height)
+    if key not in _KNIGHT_MASKS:
+        masks = []
+        for cell in range(width * height):
+            row, col = divmod(cell, width)
+            mask = 0
+            for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                           (1, -2), (1, 2), (2, -1), (2, 1)):
+                r, c = row + dr, col + dc
+                if 0 <= r < height and 0 <= c < width:
+                    mask |= 1 << (r * width + c)
+            masks.append(mask)
+        _KNIGHT_MASKS[key] = masks
+    return _KNIGHT_MASKS[key]
+
+
+def bits(mask):
+    """Return the indices of the set bits of an integer."""
+    cells = []
+    while mask:
+        low = mask & -mask
+        cells.append(low.bit_length() - 1)
+        mask ^= low
+    return cells
+
+
+def legal_moves(blank, location, masks):
+    """Return the cells the player at `location` can move to.
+
+    A location of -1 means the player has not been placed yet and may move
+    to any blank cell.
+    """
+    if location < 0:
+        return bits(blank)
+    return bits(masks[location] & blank)
+
+
+def board_state(game, player):
+    """Convert an `isolation.Board` into a bitboard state.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        The current position; `player` must be the active player.
+
+    player : object
+        The player to move.
+
+    Returns
+    -------
+    (int, int, int)
+        Mask of the blank cells and the cells of the player to move and of
+        its opponent (-1 if not placed yet).
+    """
+    width = game.width
+    blank = 0
+    for row, col in game.get_blank_spaces():
+        blank |= 1 << (row * width + col)
+
+    def cell(location):
+        return -1 if location is None else location[0] * width + location[1]
+
+    return (blank, cell(game.get_player_location(player)),
+            cell(game.get_player_location(game.get_opponent(player))))
+
+
+def playout(blank, to_move, other, masks, rng):
+    """Play random moves until one side cannot move.
+
+    Returns
+    -------
+    bool
+        True if the player to move at the start of the playout wins.
+    """
+    turn = 0
+    while True:
+        moves = legal_moves(blank, to_move, masks)
+        if not moves:
+            return turn == 1
+        move = moves[rng.randrange(len(moves))]
+        blank &= ~(1 << move)
+        to_move, other = other, move
+        turn ^= 1
+
+
+class Node:
+    """A node of the search tree.
+
+    `wins` counts the playouts won by the player who made `move`, i.e. the
+    player who is *not* to move in this node.
+    """
+
+    __slots__ = ('move', 'parent', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move, parent, untried):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0
+
+
+class TreeSearch:
+    """A single UCT search tree over bitboard states.
+
+    Parameters
+    ----------
+    width, height : int
+        Size of the board.
+
+    exploration : float
+        Exploration constant of the UCT formula.
+
+    rng : `random.Random`
+        Source of randomness for expansion and playouts.
+    """
+
+    def __init__(self, width, height, exploration, rng):
+        self.width = width
+        self.masks = knight_masks(width, height)
+        self.exploration = exploration
+        self.rng = rng
+        self.root = None
+        self.state = None
+        self.playouts = 0
+        self.max_depth = 0
+
+    def set_root(self, state):
+        """Move the root to `state`, reusing the subtree of the last search if
+        `state` is a grandchild of the old root."""
+        self.root = self.find_grandchild(state)
+        if self.root is None:
+            self.root = Node(None, None, legal_moves(state[0], state[1], self.masks))
+        self.root.parent = None
+        self.state = state
+
+    def find_grandchild(self, state):
+        """Return the node two plies below the root that matches `state`."""
+        blank, own, opp = state
+        if self.root is None or own < 0 or opp < 0:
+            return None
+        if self.state[0] & ~(1 << own) & ~(1 << opp) != blank:
+            return None
+        for child in self.root.children:
+            if child.move == own:
+                for grandchild in child.children:
+                    if grandchild.move == opp:
+                        return grandchild
+        return None
+
+    def iterate(self):
+        """Run one selection, expansion, playout and backpropagation step."""
+        blank, to_move, other = self.state
+        node = self.root
+        depth = 0
+
+        # Selection
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: child.wins / child.visits +
+                       self.exploration * math.sqrt(log_visits / child.visits))
+            blank &= ~(1 << node.move)
+            to_move, other = other, node.move
+            depth += 1
+
+        # Expansion
+        if node.untried:
+            move = node.untried.pop(self.rng.randrange(len(node.untried)))
+            blank &= ~(1 << move)
+            to_move, other = other, move
+            child = Node(move, node, legal_moves(blank, to_move, self.masks))
+            node.children.append(child)
+            node = child
+            depth += 1
+
+        # Simulation; a win for the player to move is a loss for the player
+        # who moved into the node
+        result = 0 if playout(blank, to_move, other, self.masks, self.rng) else 1
+
+        # Backpropagation
+        while node is not None:
+            node.visits += 1
+            node.wins += result
+            result = 1 - result
+            node = node.parent
+
+        self.playouts += 1
+        self.max_depth = max(self.max_depth, depth)
+
+    def run(self, time_left, threshold):
+        """Iterate until `time_left()` drops below `threshold` milliseconds."""
+        while True:
+            for _ in range(16):
+                self.iterate()
+            if time_left() < threshold:
+                break
+
+    def visit_counts(self):
+        """Return the number of visits of every root move."""
+        return {child.move: child.visits for child in self.root.children}
+
+
+def _worker_search(args):
+    """Grow an independent tree from the root until a deadline (in a worker
+    process) and return its root visit counts and the CPU time used.
+
+    The deadline is wall-clock time (`time.time()`), which is shared between
+    processes, so a worker that starts late still stops in time."""
+    state, width, height, exploration, seed, deadline = args
+    cpu_start = time.process_time()
+    tree = TreeSearch(width, height, exploration, random.Random(seed))
+    tree.set_root(state)
+    tree.run(lambda: 1000 * (deadline - time.time()), 0.)
+    return tree.visit_counts(), tree.playouts, time.process_time() - cpu_start
+
+
+class MCTS:
+    """Monte Carlo tree search move selection for a `CustomPlayer`.
+
+    Parameters
+    ----------
+    timeout : float
+        Time remaining (in milliseconds) when the search stops.
+
+    exploration : float (optional)
+        Exploration constant of UCT.
+
+    workers : int (optional)
+        Number of trees searched in parallel; workers - 1 helper processes are
+        started when the player is created.
+
+    seed : int (optional)
+        Seed of the random number generator.
+
+    ipc_margin : float (optional)
+        Milliseconds reserved for collecting the results of the helper
+        processes.
+    """
+
+    def __init__(self, timeout, exploration=math.sqrt(2), workers=1, seed=None,
+                 ipc_margin=5.):
+        self.timeout = timeout
+        self.exploration = exploration
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.ipc_margin = ipc_margin
+        self.tree = None
+        self.pool = Pool(workers - 1) if workers > 1 else None
+        # Worker results of the last search that were not back in time
+        self.late = None
+
+    def search(self, game, player, time_left, stats=None):
+        """Return the most visited root move for the player to move.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            The current position.
+
+        player : object
+            The player to move.
+
+        time_left : callable
+            Milliseconds left for this move.
+
+        stats : `SearchStats` (optional)
+            Receives the number of playouts as nodes, the deepest selection
+            as depth and the CPU time of the helper processes.
+
+        Returns
+        -------
+        (int, int)
+        """
+        # Wait for late workers of the last move, they stop at its deadline
+        if self.late is not None:
+            self.late.wait()
+            self.late = None
+
+        width, height = game.width, game.height
+        if self.tree is None or self.tree.width != width:
+            self.tree = TreeSearch(width, height, self.exploration, self.rng)
+        tree = self.tree
+        state = board_state(game, player)
+        tree.set_root(state)
+        tree.playouts = tree.max_depth = 0
+
+        pending = None
+        if self.pool is not None:
+            deadline = time.time() + (time_left() - self.timeout - self.ipc_margin) / 1000
+            tasks = [(state, width, height, self.exploration, self.rng.getrandbits(32), deadline)
+                     for _ in range(self.workers - 1)]
+            pending = self.pool.map_async(_worker_search, tasks)
+
+        tree.run(time_left, self.timeout + self.ipc_margin)
+
+        counts = tree.visit_counts()
+        playouts = tree.playouts
+        worker_time = 0.
+        if pending is not None:
+            # Results that are not back in time are dropped rather than
+            # risking a forfeit
+            try:
+                results = pending.get(max(time_left() - self.timeout, 0.) / 1000)
+            except TimeoutError:
+                results = []
+                self.late = pending
+            for visits, worker_playouts, cpu_time in results:
+                for move, count in visits.items():
+                    counts[move] = counts.get(move, 0) + count
+                playouts += worker_playouts
+                worker_time += cpu_time
+
+        if stats is not None:
+            stats.nodes = playouts
+            stats.depth_completed = tree.max_depth
+            stats.worker_time = worker_time
+
+        if not counts:
+            return (-1, -1)
+        return divmod(max(counts, key=counts.get), width)
+
+    def close(self):
+        """Shut down the helper processes."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,230 @@
+"""Fit the weights of a `WeightedScore` heuristic by self-play.
+
+The heuristic is a weighted sum of the features in `game_agent.FEATURES`
+(center distance, own mobility, opponent mobility, opponent distance and
+the opponent's move closest to the center). The weights are optimized with
+SPSA (simultaneous perturbation stochastic approximation): every iteration
+perturbs all weights at once in a random direction, plays a match between
+the two perturbed heuristics on a process pool and moves the weights
+towards the winner. The features have very different ranges (the center
+feature stays below 1, the opponent's closest move to the center reaches
+14), so steps and perturbations are scaled per weight by the inverse
+standard deviation of its feature over sampled positions (see
+`feature_scales`), e.g.
+
+    python tuning.py --iterations 50 --games 40 --output weights.json
+
+The result is written with `WeightedScore.save` and can be used as
+
+    CustomPlayer(score_fn=WeightedScore.load('weights.json'))
+"""
+import argparse
+import json
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+import benchmark
+from game_agent import FEATURES, WeightedScore, score_features
+from isolation import Board
+
+
+# custom_score expressed as weights of the features
+CUSTOM_SCORE_WEIGHTS = [5.0, 0.2, 0.0, 0.0, 0.0]
+
+
+def match(weights_a, weights_b, num_games, executor, time_limit=benchmark.TIME_LIMIT,
+          timeout=benchmark.TIMEOUT, seed=0, method='alphabeta'):
+    """Play a match between two weight vectors and return the win rate of the
+    first one.
+
+    Parameters
+    ----------
+    weights_a, weights_b : list<float>
+        Weights of the two heuristics.
+
+    num_games : int
+        Number of games, half of them with each side moving first.
+
+    executor : `concurrent.futures.Executor`
+        Runs the games in parallel.
+
+    time_limit, timeout : float
+        Time per move and timer threshold in milliseconds.
+
+    seed : int
+        Seed of the games.
+
+    method : {'minimax', 'alphabeta'}
+        Search method of both players.
+
+    Returns
+    -------
+    float
+    """
+    configs = {'a': {'score_fn': WeightedScore(weights_a), 'method': method},
+               'b': {'score_fn': WeightedScore(weights_b), 'method': method}}
+    tasks = benchmark.make_tasks(['a', 'b'], configs, num_games, time_limit, timeout, seed)
+    results = list(executor.map(benchmark.play_game, tasks))
+    return sum(result['winner'] == 'a' for result in results) / len(results)
+
+
+def feature_scales(num_positions=500, seed=0):
+    """Per-weight SPSA scales that make a step change the score by about
+    the same amount whichever feature it is on.
+
+    The features are sampled from both players' point of view in positions
+    reached by 2 to 35 random moves. The scale of a weight is the inverse
+    standard deviation of its feature (1 for a constant feature).
+
+    Parameters
+    ----------
+    num_positions : int
+        Number of random games to sample from.
+
+    seed : int
+        Seed of the random games.
+
+    Returns
+    -------
+    list<float>
+        One scale per feature, in the order of `FEATURES`.
+    """
+    rng = random.Random(seed)
+    player_1, player_2 = object(), object()
+    samples = []
+    for _ in range(num_positions):
+        game = Board(player_1, player_2)
+        for _ in range(rng.randint(2, 35)):
+            moves = game.get_legal_moves()
+            if not moves:
+                break
+            game.apply_move(rng.choice(moves))
+        for player in (player_1, player_2):
+            if not game.is_winner(player) and not game.is_loser(player):
+                samples.append(score_features(game, player))
+
+    scales = []
+    for column in zip(*samples):
+        deviation = statistics.pstdev(column)
+        scales.append(1.0 / deviation if deviation else 1.0)
+    return scales
+
+
+def spsa(initial, iterations, num_games, executor, a=1.0, c=0.5, stability=None,
+         scale=None, seed=0, callback=None, **match_args):
+    """Optimize the weights with SPSA.
+
+    Parameters
+    ----------
+    initial : list<float>
+        Start weights.
+
+    iterations : int
+        Number of SPSA steps; each one plays a match of `num_games` games.
+
+    num_games : int
+        Games per match.
+
+    executor : `concurrent.futures.Executor`
+        Runs the games in parallel.
+
+    a, c : float
+        Step size and perturbation size of the first iteration; they decay
+        with the usual SPSA exponents (0.602 and 0.101).
+
+    stability : float (optional)
+        Stability constant of the step size; defaults to 10% of the
+        iterations.
+
+    scale : list<float> (optional)
+        Per-weight scale of steps and perturbations, to account for the
+        different ranges of the features (see `feature_scales`); defaults to
+        1 for every weight.
+
+    seed : int
+        Seed of the perturbations and the games.
+
+    callback : callable (optional)
+        Called after every iteration with the iteration number, the weights
+        and the win rate of the positive perturbation.
+
+    match_args
+        Passed on to `match`.
+
+    Returns
+    -------
+    list<float>
+        The optimized weights.
+    """
+    rng = random.Random(seed)
+    theta = [float(w) for w in initial]
+    scale = scale or [1.0] * len(theta)
+    if stability is None:
+        stability = 0.1 * iterations
+
+    for k in range(iterations):
+        a_k = a / (k + 1 + stability) ** 0.602
+        c_k = c / (k + 1) ** 0.101
+        delta = [rng.choice((-1, 1)) for _ in theta]
+        plus = [t + c_k * d * s for t, d, s in zip(theta, delta, scale)]
+        minus = [t - c_k * d * s for t, d, s in zip(theta, delta, scale)]
+
+        win_rate = match(plus, minus, num_games, executor, seed=rng.getrandbits(32), **match_args)
+        # Difference of the match scores, in [-1, 1]
+        difference = 2 * win_rate - 1
+        theta = [t + a_k * s * difference / (2 * c_k * d)
+                 for t, d, s in zip(theta, delta, scale)]
+
+        if callback is not None:
+            callback(k, theta, win_rate)
+    return theta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--initial', type=float, nargs=len(FEATURES), default=CUSTOM_SCORE_WEIGHTS,
+                        help='start weights for {}'.format(', '.join(FEATURES)))
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--games', type=int, default=40, help='games per match')
+    parser.add_argument('--validation-games', type=int, default=200,
+                        help='games of the final match against the start weights')
+    parser.add_argument('--step', type=float, default=1.0,
+                        help='SPSA step size a, in standard deviations of the score per feature')
+    parser.add_argument('--perturbation', type=float, default=0.5,
+                        help='SPSA perturbation size c, in standard deviations of the score per feature')
+    parser.add_argument('--scale', type=float, nargs=len(FEATURES), default=None,
+                        help='per-weight scale of steps and perturbations (default: estimated '
+                             'from the feature ranges, 1 1 1 1 1 for unscaled SPSA)')
+    parser.add_argument('--time-limit', type=float, default=benchmark.TIME_LIMIT)
+    parser.add_argument('--timeout', type=float, default=benchmark.TIMEOUT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default='weights.json')
+    args = parser.parse_args()
+
+    history = []
+
+    def report(k, theta, win_rate):
+        history.append({'iteration': k, 'weights': theta, 'win_rate': win_rate})
+        print("{:4d}: {}  ({:.1%})".format(k, ', '.join('{:.3f}'.format(w) for w in theta), win_rate))
+
+    scale = args.scale or feature_scales(seed=args.seed)
+    print("Scales: {}".format(', '.join('{}={:.3f}'.format(name, s) for name, s in zip(FEATURES, scale))))
+
+    match_args = {'time_limit': args.time_limit, 'timeout': args.timeout}
+    with ProcessPoolExecutor(args.processes) as executor:
+        weights = spsa(args.initial, args.iterations, args.games, executor,
+                       a=args.step, c=args.perturbation, scale=scale, seed=args.seed,
+                       callback=report, **match_args)
+        win_rate = match(weights, args.initial, args.validation_games, executor,
+                         seed=args.seed, **match_args)
+
+    WeightedScore(weights).save(args.output)
+    with open(args.output.replace('.json', '') + '_history.json', 'w') as f:
+        json.dump({'history': history, 'scale': scale, 'validation_win_rate': win_rate}, f, indent=2)
+    print("Win rate against the start weights: {:.1%}".format(win_rate))
+
+
+if __name__ == '__main__':
+    main()
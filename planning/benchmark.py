@@ -0,0 +1,193 @@
+'''Benchmark suite for the air cargo planners.
+
+Runs every combination of problem and search configuration in a fresh
+process with a time limit and writes the results to a JSON file, e.g.
+
+    python benchmark.py --problems p1 p2 3x2x3 4x2x4 --configs astar_ff astar_levelsum
+
+Configurations named compact_* use the array backed searches of
+compact_search.py.
+
+Problems are either one of the fixed instances (p1, p2, p3) or a size
+NxMxK of generated instances (N cargos, M planes, K airports), which are
+generated once per seed. For each run the report contains the plan length,
+the node expansions, goal tests and new nodes counted by InstrumentedProblem,
+the wall time and the peak memory allocated by the search (measured with
+tracemalloc, which slows the search down; pass --no-memory for timings).
+With --symmetry the searches run on the SymmetryReducedProblem of each
+problem and the plans are lifted back to the original problem.
+'''
+import argparse
+import json
+import multiprocessing
+import timeit
+import tracemalloc
+
+from aimacode import search
+from aimacode.search import InstrumentedProblem
+
+import compact_search
+import my_air_cargo_problems
+from symmetry import SymmetryReducedProblem
+
+# search configurations that can be selected by name: the search function of
+# compact_search or aimacode.search and the name of the AirCargoProblem
+# heuristic, if any
+CONFIGS = {
+    'breadth_first': ('breadth_first_search', None),
+    'depth_first': ('depth_first_graph_search', None),
+    'uniform_cost': ('uniform_cost_search', None),
+    'greedy_h1': ('greedy_best_first_graph_search', 'h_1'),
+    'greedy_ff': ('greedy_best_first_graph_search', 'h_ff'),
+    'astar_h1': ('astar_search', 'h_1'),
+    'astar_ignore_preconditions': ('astar_search', 'h_ignore_preconditions'),
+    'astar_ignore_preconditions_cover': ('astar_search', 'h_ignore_preconditions_cover'),
+    'astar_levelsum': ('astar_search', 'h_pg_levelsum'),
+    'astar_maxlevel': ('astar_search', 'h_pg_maxlevel'),
+    'astar_setlevel': ('astar_search', 'h_pg_setlevel'),
+    'astar_max': ('astar_search', 'h_max'),
+    'astar_add': ('astar_search', 'h_add'),
+    'astar_ff': ('astar_search', 'h_ff'),
+    'astar_pdb': ('astar_search', 'h_pdb'),
+    'compact_uniform_cost': ('compact_uniform_cost_search', None),
+    'compact_greedy_ff': ('compact_greedy_search', 'h_ff'),
+    'compact_astar_ignore_preconditions': ('compact_astar_search', 'h_ignore_preconditions'),
+    'compact_astar_levelsum': ('compact_astar_search', 'h_pg_levelsum'),
+    'compact_astar_ff': ('compact_astar_search', 'h_ff'),
+    'compact_astar_pdb': ('compact_astar_search', 'h_pdb'),
+}
+
+PROBLEMS = {
+    'p1': my_air_cargo_problems.air_cargo_p1,
+    'p2': my_air_cargo_problems.air_cargo_p2,
+    'p3': my_air_cargo_problems.air_cargo_p3,
+}
+
+TIME_LIMIT = 600.
+
+
+def make_problem(name, seed=0):
+    '''create a fixed or generated problem
+
+    :param name: str
+        key of PROBLEMS, or size 'NxMxK' of a generated problem
+    :param seed: int
+        seed of a generated problem
+    :return: AirCargoProblem
+    '''
+    if name in PROBLEMS:
+        return PROBLEMS[name]()
+    n_cargos, m_planes, k_airports = (int(x) for x in name.split('x'))
+    return my_air_cargo_problems.air_cargo_generated(n_cargos, m_planes, k_airports, seed)
+
+
+def solve(problem, config):
+    '''run one search configuration on a problem
+
+    :param problem: AirCargoProblem
+    :param config: str or (str, str)
+        key of CONFIGS, or the pair of search function and heuristic names
+    :return: (Node or None, InstrumentedProblem)
+        the goal node (None if no plan was found) and the counters of the search
+    '''
+    search_name, heuristic = CONFIGS[config] if isinstance(config, str) else config
+    instrumented = InstrumentedProblem(problem)
+    search_fn = getattr(compact_search, search_name, None) or getattr(search, search_name)
+    if heuristic is None:
+        node = search_fn(instrumented)
+    else:
+        node = search_fn(instrumented, getattr(problem, heuristic))
+    return node, instrumented
+
+
+def run_task(task, connection):
+    '''solve a problem in a worker process and send the result through a pipe
+
+    :param task: dict
+        problem name, seed, config, whether to trace memory and whether to reduce symmetries
+    :param connection: multiprocessing.Connection
+    '''
+    try:
+        problem = make_problem(task['problem'], task['seed'])
+        if task.get('symmetry'):
+            problem = SymmetryReducedProblem(problem)
+        if task['memory']:
+            tracemalloc.start()
+        start = timeit.default_timer()
+        node, instrumented = solve(problem, task['config'])
+        elapsed = timeit.default_timer() - start
+        peak = tracemalloc.get_traced_memory()[1] if task['memory'] else None
+        plan = node.solution() if node is not None else None
+        if plan is not None and task.get('symmetry'):
+            plan = problem.lift_plan(plan)
+        result = {'solved': plan is not None,
+                  'plan_length': len(plan) if plan is not None else None,
+                  'plan': [str(action.name) + str(action.args) for action in plan]
+                  if plan is not None else None,
+                  'expansions': instrumented.succs,
+                  'goal_tests': instrumented.goal_tests,
+                  'new_nodes': instrumented.states,
+                  'time': elapsed,
+                  'peak_memory': peak,
+                  'outcome': 'done'}
+    except Exception as e:
+        result = {'outcome': 'error', 'solved': False, 'error': repr(e)}
+    connection.send(result)
+    connection.close()
+
+
+def run(task, time_limit=TIME_LIMIT):
+    '''run a task in a fresh process, killing it when it exceeds the time limit
+
+    :param task: dict
+    :param time_limit: float (seconds)
+    :return: dict
+        the task merged with its result
+    '''
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_task, args=(task, sender))
+    process.start()
+    if receiver.poll(time_limit):
+        result = receiver.recv()
+    else:
+        result = {'outcome': 'timeout', 'solved': False, 'time': time_limit}
+    if process.is_alive():
+        process.terminate()
+    process.join()
+    return dict(task, **result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--problems', nargs='+', default=sorted(PROBLEMS),
+                        help='p1, p2, p3 or NxMxK for N cargos, M planes and K airports')
+    parser.add_argument('--configs', nargs='+', default=sorted(CONFIGS),
+                        help='search configurations: {}'.format(', '.join(sorted(CONFIGS))))
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0],
+                        help='seeds of the generated problems')
+    parser.add_argument('--time-limit', type=float, default=TIME_LIMIT, help='seconds per run')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace memory allocations')
+    parser.add_argument('--symmetry', action='store_true', help='search modulo interchangeable cargos and planes')
+    parser.add_argument('--output', default='planning_benchmark.json')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.problems:
+        for seed in (args.seeds if name not in PROBLEMS else [0]):
+            for config in args.configs:
+                task = {'problem': name, 'seed': seed, 'config': config, 'memory': not args.no_memory,
+                        'symmetry': args.symmetry}
+                result = run(task, args.time_limit)
+                results.append(result)
+                print("{:>8} seed {:<4} {:>28}: {:8} {:>4} steps {:8} expansions {:9.3f}s{}".format(
+                    name, seed, config, result['outcome'],
+                    result.get('plan_length') if result.get('plan_length') is not None else '-',
+                    result.get('expansions', '-'), result.get('time') or 0.,
+                    '  {:.1f} MB'.format(result['peak_memory'] / 2**20) if result.get('peak_memory') else ''))
+
+    with open(args.output, 'w') as f:
+        json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
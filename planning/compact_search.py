@@ -0,0 +1,351 @@
+'''Memory compact best-first search for AirCargoProblem.
+
+The aimacode searches keep a Node object per generated state and store the
+states as T/F strings in dicts and sets. The searches in this module work on
+the bit mask encoding of the states instead: the nodes are records in
+parallel arrays (state, parent index, action id, path cost), the open list
+keeps node indices in arrays bucketed by priority, and states are mapped to
+their best node by an open addressing hash table over a flat array. A plan is
+reconstructed by following the parent indices.
+
+All actions cost 1, and heuristics are expected to return integers (or inf
+for dead ends).
+'''
+import heapq
+from array import array
+
+from aimacode.search import InstrumentedProblem
+
+INF = float("inf")
+
+# states of up to this many fluents are stored in 64 bit arrays
+MAX_PACKED_FLUENTS = 63
+
+
+class NodeStore():
+    '''
+    Search nodes as records of parallel arrays, indexed by node number.
+
+    Args:
+    ----------
+    packed : bool
+        whether the states fit into 64 bit unsigned integers; if not they are
+        kept in a list
+
+    capacity : int
+        number of records allocated up front; the arrays double when full
+    '''
+
+    def __init__(self, packed=True, capacity=1024):
+        self.size = 0
+        self.capacity = capacity
+        self.states = array('Q', bytes(8 * capacity)) if packed else [0] * capacity
+        self.parents = array('q', bytes(8 * capacity))
+        self.actions = array('l', bytes(array('l').itemsize * capacity))
+        self.costs = array('l', bytes(array('l').itemsize * capacity))
+
+    def __len__(self):
+        return self.size
+
+    def grow(self):
+        '''double the capacity of the arrays (the appended values are placeholders)'''
+        for column in (self.states, self.parents, self.actions, self.costs):
+            column.extend(column[:self.capacity])
+        self.capacity *= 2
+
+    def add(self, state: int, parent: int, action: int, cost: int) -> int:
+        '''append a node
+
+        :param state: int, state as bit mask
+        :param parent: int, index of the parent node (-1 for the root)
+        :param action: int, index into actions_list of the action leading here (-1 for the root)
+        :param cost: int, path cost
+        :return: int, index of the node
+        '''
+        if self.size == self.capacity:
+            self.grow()
+        index = self.size
+        self.states[index] = state
+        self.parents[index] = parent
+        self.actions[index] = action
+        self.costs[index] = cost
+        self.size += 1
+        return index
+
+    def path(self, index: int) -> list:
+        '''action ids from the root to a node
+
+        :param index: int
+        :return: list of int
+        '''
+        actions = []
+        while self.parents[index] >= 0:
+            actions.append(self.actions[index])
+            index = self.parents[index]
+        actions.reverse()
+        return actions
+
+    def nbytes(self) -> int:
+        '''memory used by the arrays (lower bound if the states are a list)
+
+        :return: int
+        '''
+        columns = (self.parents, self.actions, self.costs)
+        total = sum(column.itemsize * len(column) for column in columns)
+        if isinstance(self.states, array):
+            total += self.states.itemsize * len(self.states)
+        return total
+
+
+class StateTable():
+    '''
+    Hash map from states packed in 64 bit unsigned integers to node indices.
+
+    Open addressing with linear probing over two flat arrays; a stored key is
+    the state + 1 so that 0 marks an empty slot. The table doubles when it is
+    half full.
+
+    Args:
+    ----------
+    capacity : int
+        initial number of slots, a power of two
+    '''
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.allocate(capacity)
+
+    def allocate(self, capacity: int):
+        self.capacity = capacity
+        self.shift = 64 - (capacity.bit_length() - 1)
+        self.keys = array('Q', bytes(8 * capacity))
+        self.values = array('q', bytes(8 * capacity))
+
+    def __len__(self):
+        return self.size
+
+    def slot(self, key: int) -> int:
+        '''slot of a key, or the empty slot where it would be stored
+
+        :param key: int, state + 1
+        :return: int
+        '''
+        keys = self.keys
+        mask = self.capacity - 1
+        # Fibonacci hashing spreads similar bit masks over the table
+        ii = ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        while keys[ii] != 0 and keys[ii] != key:
+            ii = (ii + 1) & mask
+        return ii
+
+    def get(self, state: int, default=None):
+        ii = self.slot(state + 1)
+        if self.keys[ii] == 0:
+            return default
+        return self.values[ii]
+
+    def __setitem__(self, state: int, value: int):
+        key = state + 1
+        ii = self.slot(key)
+        if self.keys[ii] == 0:
+            if 2 * (self.size + 1) > self.capacity:
+                self.rehash()
+                ii = self.slot(key)
+            self.keys[ii] = key
+            self.size += 1
+        self.values[ii] = value
+
+    def rehash(self):
+        '''double the number of slots and reinsert all entries'''
+        keys, values = self.keys, self.values
+        self.allocate(2 * self.capacity)
+        for key, value in zip(keys, values):
+            if key:
+                ii = self.slot(key)
+                self.keys[ii] = key
+                self.values[ii] = value
+
+    def nbytes(self) -> int:
+        return 16 * self.capacity
+
+
+class OpenList():
+    '''
+    Priority queue of node indices for integer priorities.
+
+    Nodes with the same priority share a bucket, an array used as a stack, so
+    an entry takes 8 bytes; only the distinct priorities are kept in a heap.
+    Priorities are compared as tuples, e.g. (f, h) to prefer nodes closer to
+    the goal among those with the same f.
+    '''
+
+    def __init__(self):
+        self.buckets = {}
+        self.priorities = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, priority: tuple, index: int):
+        bucket = self.buckets.get(priority)
+        if bucket is None:
+            bucket = self.buckets[priority] = array('q')
+            heapq.heappush(self.priorities, priority)
+        bucket.append(index)
+        self.size += 1
+
+    def pop(self) -> int:
+        '''remove and return a node index of the lowest priority
+
+        :return: int
+        '''
+        priority = self.priorities[0]
+        bucket = self.buckets[priority]
+        index = bucket.pop()
+        if not bucket:
+            del self.buckets[priority]
+            heapq.heappop(self.priorities)
+        self.size -= 1
+        return index
+
+
+class StateView():
+    '''Stand-in for a search Node when calling heuristics, which only read `state`'''
+    __slots__ = ('state',)
+
+
+class SearchResult():
+    '''
+    Outcome of a compact search, with the solution() interface of aimacode nodes.
+
+    Args:
+    ----------
+    problem : AirCargoProblem
+    action_ids : list of int
+        indices into problem.actions_list of the plan
+    state : int
+        the goal state as bit mask
+    expansions, goal_tests, generated : int
+        search counters
+    '''
+
+    def __init__(self, problem, action_ids, state, expansions, goal_tests, generated):
+        self.problem = problem
+        self.action_ids = action_ids
+        self.state = state
+        self.path_cost = len(action_ids)
+        self.expansions = expansions
+        self.goal_tests = goal_tests
+        self.generated = generated
+
+    def solution(self) -> list:
+        '''the plan as list of Action'''
+        return [self.problem.actions_list[ii] for ii in self.action_ids]
+
+
+def best_first_search(problem, h=None, g_weight=1, h_weight=1):
+    '''Best-first graph search on the bit mask states of an AirCargoProblem
+
+    Nodes are ordered by f = g_weight * g + h_weight * h, ties in favour of the
+    lower h and then of the node generated last. A state is expanded again if it
+    is reached with a lower path cost later (only with inconsistent heuristics).
+    If the problem has a `canonical_bits` method (see SymmetryReducedProblem), the
+    successor states are replaced by their canonical states.
+
+    :param problem: AirCargoProblem or SymmetryReducedProblem (or an InstrumentedProblem
+        wrapping one, whose expansion and new node counters are updated; it counts goal
+        tests itself)
+    :param h: heuristic taking an object with a `state` attribute, or None
+    :param g_weight: int
+    :param h_weight: int
+    :return: SearchResult, or None if there is no plan
+    '''
+    packed = len(problem.state_map) <= MAX_PACKED_FLUENTS
+    store = NodeStore(packed)
+    best = StateTable() if packed else {}
+    view = StateView()
+    action_masks = problem.action_masks
+    canonical = getattr(problem, 'canonical_bits', None)
+    expansions = goal_tests = generated = 0
+
+    def priority(g, state):
+        if h is None or not h_weight:
+            return g_weight * g, 0
+        view.state = state
+        value = h(view)
+        if value == INF:
+            return None
+        return int(g_weight * g + h_weight * value), int(value)
+
+    start = problem.initial_state_bits
+    frontier = OpenList()
+    f = priority(0, start)
+    if f is not None:
+        index = store.add(start, -1, -1, 0)
+        best[start] = index
+        frontier.push(f, index)
+
+    result = None
+    while frontier:
+        index = frontier.pop()
+        state = store.states[index]
+        if best.get(state) != index:
+            # a cheaper path to the state was found after this node was queued
+            continue
+        goal_tests += 1
+        if problem.goal_test(state):
+            result = SearchResult(problem, store.path(index), state, expansions, goal_tests, generated)
+            break
+
+        expansions += 1
+        g = store.costs[index] + 1
+        for a_id in problem.applicable(state):
+            masks = action_masks[a_id]
+            child = (state & ~masks.rem) | masks.add
+            if canonical is not None:
+                child = canonical(child)
+            generated += 1
+            known = best.get(child)
+            if known is not None and store.costs[known] <= g:
+                continue
+            f = priority(g, child)
+            if f is None:
+                continue
+            child_index = store.add(child, index, a_id, g)
+            best[child] = child_index
+            frontier.push(f, child_index)
+
+    if isinstance(problem, InstrumentedProblem):
+        problem.succs += expansions
+        problem.states += generated
+    return result
+
+
+def compact_astar_search(problem, h=None):
+    '''A* search (f = g + h) with compact node storage
+
+    :param problem: AirCargoProblem
+    :param h: heuristic, e.g. problem.h_ignore_preconditions; None for uniform cost search
+    :return: SearchResult or None
+    '''
+    return best_first_search(problem, h, 1, 1)
+
+
+def compact_greedy_search(problem, h=None):
+    '''Greedy best-first search (f = h) with compact node storage
+
+    :param problem: AirCargoProblem
+    :param h: heuristic
+    :return: SearchResult or None
+    '''
+    return best_first_search(problem, h, 0, 1)
+
+
+def compact_uniform_cost_search(problem):
+    '''Uniform cost search (f = g) with compact node storage
+
+    :param problem: AirCargoProblem
+    :return: SearchResult or None
+    '''
+    return best_first_search(problem, None, 1, 0)
@@ -0,0 +1,117 @@
+'''Bounded memoization of heuristic values by state.
+
+Searches regenerate the same states through different paths; the heuristic
+methods of a problem decorated with `cached_heuristic` look their value up in
+the problem's `heuristic_cache` before computing it.
+'''
+import functools
+import sys
+from collections import OrderedDict
+
+# approximate size of an entry besides the state itself: the ordered dict
+# slot and link, the key tuple and the value
+ENTRY_OVERHEAD = 200
+
+
+class HeuristicCache():
+    '''
+    LRU cache of heuristic values keyed by (heuristic name, encoded state).
+
+    Args:
+    ----------
+    max_entries : int
+        maximum number of cached values
+
+    max_bytes : int or None
+        approximate memory cap of the cache; None for no cap besides max_entries
+    '''
+
+    def __init__(self, max_entries=2**16, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''cached value of a key, marking it as recently used
+
+        :param key: hashable
+        :return: the value, or None if the key is not cached
+        '''
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        '''store a value, evicting the least recently used entries above the caps
+
+        :param key: tuple (name, state)
+        :param value: heuristic value (not None)
+        '''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.size += self.entry_size(key)
+        self.entries[key] = value
+        while self.entries and (len(self.entries) > self.max_entries or
+                                (self.max_bytes is not None and self.size > self.max_bytes)):
+            old_key, _ = self.entries.popitem(last=False)
+            self.size -= self.entry_size(old_key)
+            self.evictions += 1
+
+    @staticmethod
+    def entry_size(key) -> int:
+        '''approximate memory used by an entry
+
+        :param key: tuple (name, state)
+        :return: int (bytes)
+        '''
+        return ENTRY_OVERHEAD + sys.getsizeof(key[-1])
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def clear(self):
+        '''remove all entries and reset the counters'''
+        self.entries.clear()
+        self.size = self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        '''counters of the cache
+
+        :return: dict
+        '''
+        return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hit_rate}
+
+
+def cached_heuristic(h):
+    '''decorator for heuristic methods of a problem with `heuristic_cache` and `state_to_bits`
+
+    The value is cached under the name of the method and the state as bit mask, so T/F
+    string and int states share entries. No caching if `heuristic_cache` is None.
+    '''
+    @functools.wraps(h)
+    def cached(problem, node):
+        cache = problem.heuristic_cache
+        if cache is None:
+            return h(problem, node)
+        key = (h.__name__, problem.state_to_bits(node.state))
+        value = cache.get(key)
+        if value is None:
+            value = h(problem, node)
+            cache.put(key, value)
+        return value
+    return cached
@@ -1,19 +1,44 @@
+import random
+from collections import namedtuple
+
 from aimacode.logic import PropKB
 from aimacode.planning import Action
 from aimacode.search import (
     Node, Problem,
 )
-from aimacode.utils import expr
+from aimacode.utils import Expr, expr
 from lp_utils import (
     FluentState, encode_state, decode_state,
 )
-from my_planning_graph import PlanningGraph
+from heuristic_cache import HeuristicCache, cached_heuristic
+from my_planning_graph import PlanningGraph, bit_indices
+from pattern_databases import PatternDatabaseHeuristic
+from relaxed_heuristics import RelaxedHeuristics
+
+# translation tables between T/F state strings and binary digits
+_TF_TO_BITS = str.maketrans('TF', '10')
+_BITS_TO_TF = str.maketrans('10', 'TF')
+
+# preconditions and effects of a ground action as bit masks over state_map, plus
+# the state_map indices of the effects for updating T/F strings in place
+ActionMasks = namedtuple('ActionMasks', ['pre_pos', 'pre_neg', 'add', 'rem', 'add_idx', 'rem_idx'])
 
 
 class AirCargoProblem(Problem):
     def __init__(self, cargos, planes, airports, initial: FluentState, goal: list):
         """
 
+        States are accepted in two encodings: the T/F string of the aimacode
+        interface (e.g. 'TFTF', used for `initial`) and a Python int whose
+        bit i is set if state_map[i] holds. actions(), result() and
+        goal_test() work on bit masks internally and return states in the
+        encoding they were given, so a search started from
+        `initial_state_bits` never builds strings or FluentState lists.
+
+        Heuristic values are memoized per state in `heuristic_cache`, a
+        HeuristicCache shared by all heuristic methods; set it to None to
+        disable caching.
+
         :param cargos: list of str
             cargos in the problem
         :param planes: list of str
@@ -33,6 +58,118 @@ class AirCargoProblem(Problem):
         self.airports = airports
         self.actions_list = self.get_actions()
 
+        self.state_index = {fluent: ii for ii, fluent in enumerate(self.state_map)}
+        self.initial_state_bits = self.state_to_bits(self.initial_state_TF)
+        self.goal_mask = self.fluent_mask(self.goal)
+        self.action_index = {action: ii for ii, action in enumerate(self.actions_list)}
+        self.action_masks = [self.compile_action(a) for a in self.actions_list]
+        self.index_preconditions()
+        self.relaxed = RelaxedHeuristics(self.action_masks, self.goal_mask, len(self.state_map))
+        self.heuristic_cache = HeuristicCache()
+        # built on first use by min_goal_cover; the memo is a bounded HeuristicCache
+        self.goal_cover_costs = None
+        self.goal_cover_masks = None
+        # PatternDatabaseHeuristic of h_pdb, built on first use unless set
+        self.pattern_databases = None
+
+    def state_to_bits(self, state) -> int:
+        """ Convert a state to its bit mask encoding
+
+        :param state: str or int
+            T/F string or bit mask (returned unchanged)
+        :return: int
+        """
+        if isinstance(state, int):
+            return state
+        return int(state[::-1].translate(_TF_TO_BITS) or '0', 2)
+
+    def bits_to_state(self, bits: int) -> str:
+        """ Convert a bit mask to the T/F string encoding of the state
+
+        :param bits: int
+        :return: str
+        """
+        return '{:0{}b}'.format(bits, len(self.state_map))[::-1].translate(_BITS_TO_TF)
+
+    def state_to_tf(self, state) -> str:
+        """ Return the T/F string of a state given in either encoding
+
+        :param state: str or int
+        :return: str
+        """
+        if isinstance(state, int):
+            return self.bits_to_state(state)
+        return state
+
+    def fluent_mask(self, fluents):
+        """ Bit mask of a list of fluents
+
+        :param fluents: list of expr
+        :return: int, or None if a fluent is not part of the state map (so it can never hold)
+        """
+        mask = 0
+        for fluent in fluents:
+            if fluent not in self.state_index:
+                return None
+            mask |= 1 << self.state_index[fluent]
+        return mask
+
+    def compile_action(self, action: Action):
+        """ Precompile the preconditions and effects of an action into bit masks
+
+        Effects on fluents outside of the state map are dropped, like encode_state does.
+
+        :param action: Action
+        :return: ActionMasks, or None if the action can never be applied
+        """
+        pre_pos = self.fluent_mask(action.precond_pos)
+        pre_neg = self.fluent_mask(action.precond_neg)
+        if pre_pos is None or pre_neg is None:
+            return None
+        add_idx = tuple(self.state_index[f] for f in action.effect_add if f in self.state_index)
+        rem_idx = tuple(self.state_index[f] for f in action.effect_rem if f in self.state_index)
+        add = sum(1 << ii for ii in set(add_idx))
+        rem = sum(1 << ii for ii in set(rem_idx))
+        return ActionMasks(pre_pos, pre_neg, add, rem, add_idx, rem_idx)
+
+    def masks_of(self, action: Action):
+        """ ActionMasks of an action, compiling it if it is not in actions_list
+
+        :param action: Action
+        :return: ActionMasks or None
+        """
+        ii = self.action_index.get(action)
+        if ii is None:
+            return self.compile_action(action)
+        return self.action_masks[ii]
+
+    def index_preconditions(self):
+        """ Build the index used by actions() to find applicable actions
+
+        Every action is filed under one of its positive preconditions, its
+        trigger: the one shared by the fewest actions. Expanding a state then
+        only looks at the actions whose trigger holds instead of scanning all
+        ground actions. Actions without positive preconditions are checked in
+        every state; actions that can never be applied are not indexed at all.
+        """
+        usage = {}
+        for masks in self.action_masks:
+            if masks is not None:
+                for f in bit_indices(masks.pre_pos):
+                    usage[f] = usage.get(f, 0) + 1
+
+        self.precondition_index = {}
+        self.unindexed_actions = []
+        for ii, masks in enumerate(self.action_masks):
+            if masks is None:
+                continue
+            if not masks.pre_pos:
+                self.unindexed_actions.append(ii)
+                continue
+            trigger = min(bit_indices(masks.pre_pos), key=lambda f: (usage[f], f))
+            self.precondition_index.setdefault(trigger, []).append(ii)
+        self.trigger_mask = sum(1 << f for f in self.precondition_index)
+
     def get_actions(self):
         '''
         This method creates concrete actions (no variables) for all actions in the problem
@@ -40,6 +177,10 @@ class AirCargoProblem(Problem):
         aimacode.planning module. It is computationally expensive to call this method directly;
         however, it is called in the constructor and the results cached in the `actions_list` property.
 
+        Fluents and action names are built as Expr objects directly instead of parsing strings;
+        fluents of the state map are reused, so actions and states share the same objects.
+        Actions that can never become applicable are left out, see prune_unreachable.
+
         Returns:
         ----------
         list<Action>
@@ -52,6 +193,19 @@ class AirCargoProblem(Problem):
         # or 'Load(C2, P2, JFK)'.  The actions for the planning problem must be concrete because the problems in
         # forward search and Planning Graphs must use Propositional Logic
 
+        symbols = {name: Expr(name) for name in self.cargos + self.planes + self.airports}
+        fluents = {(f.op,) + tuple(arg.op for arg in f.args): f for f in self.state_map}
+
+        def fluent(op, *args):
+            '''Interned fluent expr for a predicate and object names
+
+            :return: expr
+            '''
+            key = (op,) + args
+            if key not in fluents:
+                fluents[key] = Expr(op, *(symbols[arg] for arg in args))
+            return fluents[key]
+
         def load_actions():
             '''Create all concrete Load actions and return a list
 
@@ -62,18 +216,18 @@ class AirCargoProblem(Problem):
                 for p in self.planes:
                     for c in self.cargos:
                         precond_pos = [
-                            expr("At({}, {})".format(c,a)),
-                            expr("At({}, {})".format(p,a)),
+                            fluent('At', c, a),
+                            fluent('At', p, a),
                         ]
                         precond_neg = []
                         effect_add = [
-                            expr("In({}, {})".format(c,p)),
+                            fluent('In', c, p),
                         ]
                         effect_rem = [
-                            expr("At({}, {})".format(c,a))
+                            fluent('At', c, a)
                         ]
 
-                        load = Action(expr("Load({}, {}, {})".format(c,p,a)), [precond_pos, precond_neg], [effect_add, effect_rem] )
+                        load = Action(Expr('Load', symbols[c], symbols[p], symbols[a]), [precond_pos, precond_neg], [effect_add, effect_rem] )
                         loads.append(load)
 
             return loads
@@ -88,18 +242,18 @@ class AirCargoProblem(Problem):
                 for p in self.planes:
                     for c in self.cargos:
                         precond_pos = [
-                            expr("In({}, {})".format(c,p)),
-                            expr("At({}, {})".format(p,a)),
+                            fluent('In', c, p),
+                            fluent('At', p, a),
                         ]
                         precond_neg = []
                         effect_add = [
-                            expr("At({}, {})".format(c,a)),
+                            fluent('At', c, a),
                         ]
                         effect_rem = [
-                            expr("In({}, {})".format(c,p))
+                            fluent('In', c, p)
                         ]
 
-                        unload = Action( expr("Unload({}, {}, {})".format(c,p,a)), [precond_pos, precond_neg], [effect_add, effect_rem] )
+                        unload = Action(Expr('Unload', symbols[c], symbols[p], symbols[a]), [precond_pos, precond_neg], [effect_add, effect_rem] )
                         unloads.append(unload)
             return unloads
 
@@ -113,82 +267,149 @@ class AirCargoProblem(Problem):
                 for to in self.airports:
                     if fr != to:
                         for p in self.planes:
-                            precond_pos = [expr("At({}, {})".format(p, fr)),
+                            precond_pos = [fluent('At', p, fr),
                                            ]
                             precond_neg = []
-                            effect_add = [expr("At({}, {})".format(p, to))]
-                            effect_rem = [expr("At({}, {})".format(p, fr))]
-                            fly = Action(expr("Fly({}, {}, {})".format(p, fr, to)),
+                            effect_add = [fluent('At', p, to)]
+                            effect_rem = [fluent('At', p, fr)]
+                            fly = Action(Expr('Fly', symbols[p], symbols[fr], symbols[to]),
                                          [precond_pos, precond_neg],
                                          [effect_add, effect_rem])
                             flys.append(fly)
             return flys
 
-        return load_actions() + unload_actions() + fly_actions()
+        return self.prune_unreachable(load_actions() + unload_actions() + fly_actions())
+
+    def prune_unreachable(self, actions: list) -> list:
+        '''Remove the actions whose preconditions can never hold
+
+        Reachability is checked in the delete relaxation from the initial state:
+        the positive fluents of the initial state are reached, and an action is
+        reachable once all of its positive preconditions are; its add effects are
+        reached as well. Negative preconditions are ignored, so every action that
+        may become applicable is kept.
 
-    def actions(self, state: str) -> list:
+        In air cargo problems this removes nothing as long as every cargo and
+        plane starts at an airport (all example and generated problems): a plane
+        can fly between any two airports, so it reaches every airport, and so
+        does every cargo by Load and Unload. Only the actions of objects without
+        an initial location are dropped. The check is kept because it is cheap
+        (linear in the number of actions per round) and protects the search from
+        hand-written problems with incomplete initial states.
+
+        :param actions: list of Action
+        :return: list of Action, the reachable actions in their original order
+        '''
+        reached = {f for f, value in zip(self.state_map, self.initial_state_TF) if value == 'T'}
+        reachable = set()
+        pending = actions
+        changed = True
+        while changed:
+            changed = False
+            waiting = []
+            for action in pending:
+                if all(p in reached for p in action.precond_pos):
+                    reachable.add(action)
+                    for e in action.effect_add:
+                        if e not in reached:
+                            reached.add(e)
+                            changed = True
+                else:
+                    waiting.append(action)
+            pending = waiting
+        return [action for action in actions if action in reachable]
+
+    def applicable(self, bits: int) -> list:
+        """ Indices into actions_list of the actions applicable in a state
+
+        :param bits: int
+            state as bit mask
+        :return: list of int, in ascending order
+        """
+        candidates = list(self.unindexed_actions)
+        for f in bit_indices(bits & self.trigger_mask):
+            candidates.extend(self.precondition_index[f])
+        # keep the order of actions_list so that searches break ties as before
+        candidates.sort()
+
+        action_masks = self.action_masks
+        return [ii for ii in candidates
+                if bits & action_masks[ii].pre_pos == action_masks[ii].pre_pos
+                and not bits & action_masks[ii].pre_neg]
+
+    def actions(self, state) -> list:
         """ Return the actions that can be executed in the given state.
 
-        :param state: str
+        :param state: str or int
             state represented as T/F string of mapped fluents (state variables)
-            e.g. 'FTTTFF'
+            e.g. 'FTTTFF', or as bit mask
         :return: list of Action objects
         """
-        possible_actions = []
-
-        actual_state = decode_state(state, self.state_map)
-
-        for a in self.actions_list:
-            sat = True
-            for p in a.precond_pos:
-                if p not in actual_state.pos:
-                    sat = False
-                    break
-            if sat:
-                for n in a.precond_neg:
-                    if n not in actual_state.neg:
-                        sat = False
-                        break
-            if sat:
-                possible_actions.append(a)
-            
-
-        return possible_actions
+        return [self.actions_list[ii] for ii in self.applicable(self.state_to_bits(state))]
+
+    @staticmethod
+    def apply(state, masks: ActionMasks):
+        """ Apply compiled effects to a state without decoding it
+
+        Bit masks are updated with two bit operations; T/F strings only have
+        the characters of the effects replaced.
+
+        :param state: str or int
+        :param masks: ActionMasks
+        :return: the resulting state, in the encoding of `state`
+        """
+        if isinstance(state, int):
+            # added fluents win over removed ones, as in encode_state
+            return (state & ~masks.rem) | masks.add
+        chars = list(state)
+        for ii in masks.rem_idx:
+            chars[ii] = 'F'
+        for ii in masks.add_idx:
+            chars[ii] = 'T'
+        return ''.join(chars)
+
+    def successors(self, state):
+        """ Generate the applicable actions of a state with their resulting states
+
+        Equivalent to calling result() for every action of actions(state), but the
+        state is decoded once and the compiled effects are applied directly.
+
+        :param state: str or int
+        :return: iterator of (Action, state) pairs, the states in the encoding of `state`
+        """
+        for ii in self.applicable(self.state_to_bits(state)):
+            yield self.actions_list[ii], self.apply(state, self.action_masks[ii])
 
     def result(self, state: str, action: Action):
         """ Return the state that results from executing the given
         action in the given state. The action must be one of
         self.actions(state).
 
-        :param state: state entering node
+        :param state: state entering node (str or int)
         :param action: Action applied
-        :return: resulting state after action
+        :return: resulting state after action, in the encoding of `state`
         """
-        actual_state = decode_state(state,self.state_map)
-        pos_list = action.effect_add + [ p for p in actual_state.pos if p not in action.effect_rem]
-        neg_list = action.effect_rem + [ p for p in actual_state.neg if p not in action.effect_add]
-        new_state = FluentState(pos_list, neg_list)
-        return encode_state(new_state, self.state_map)
+        masks = self.masks_of(action)
+        if masks is None:
+            return state
+        return self.apply(state, masks)
 
     def goal_test(self, state: str) -> bool:
         """ Test the state to see if goal is reached
 
-        :param state: str representing state
+        :param state: str or int representing state
         :return: bool
         """
-
-        actual_state = decode_state(state,self.state_map)
-        for s in self.goal:
-            if s not in actual_state.pos:
-                return False
-
-        return True
+        if self.goal_mask is None:
+            return False
+        return self.state_to_bits(state) & self.goal_mask == self.goal_mask
 
     def h_1(self, node: Node):
         # note that this is not a true heuristic
         h_const = 1
         return h_const
 
+    @cached_heuristic
     def h_pg_levelsum(self, node: Node):
         '''
         This heuristic uses a planning graph representation of the problem
@@ -197,26 +418,134 @@ class AirCargoProblem(Problem):
         condition.
         '''
         # requires implemented PlanningGraph class
-        pg = PlanningGraph(self, node.state)
+        pg = PlanningGraph(self, node.state, goal_directed=True)
         pg_levelsum = pg.h_levelsum()
         return pg_levelsum
 
+    @cached_heuristic
+    def h_pg_maxlevel(self, node: Node):
+        '''
+        The level of the planning graph at which the last of the goal conditions
+        first appears. Admissible.
+        '''
+        pg = PlanningGraph(self, node.state, goal_directed=True)
+        return pg.h_maxlevel()
+
+    @cached_heuristic
+    def h_pg_setlevel(self, node: Node):
+        '''
+        The first level of the planning graph at which all goal conditions appear
+        without any pair of them being mutex. Admissible and at least h_pg_maxlevel.
+        '''
+        pg = PlanningGraph(self, node.state, goal_directed=True)
+        return pg.h_setlevel()
+
+    @cached_heuristic
+    def h_max(self, node: Node):
+        '''
+        Delete relaxation heuristic: the relaxed cost of the most expensive goal
+        fluent. Admissible, but weaker than h_add and h_ff.
+        '''
+        return self.relaxed.h_max(self.state_to_bits(node.state))
+
+    @cached_heuristic
+    def h_add(self, node: Node):
+        '''
+        Delete relaxation heuristic: the sum of the relaxed costs of the goal
+        fluents. Not admissible, since shared subgoals are counted repeatedly.
+        '''
+        return self.relaxed.h_add(self.state_to_bits(node.state))
+
+    @cached_heuristic
+    def h_ff(self, node: Node):
+        '''
+        FF heuristic: the number of actions of a relaxed plan that reaches all goal
+        fluents when delete effects are ignored. Not admissible, but much cheaper
+        than h_pg_levelsum since no planning graph or mutexes are built.
+        '''
+        return self.relaxed.h_ff(self.state_to_bits(node.state))
+
     def h_ignore_preconditions(self, node: Node):
         '''
         This heuristic estimates the minimum number of actions that must be
         carried out from the current state in order to satisfy all of the goal
         conditions by ignoring the preconditions required for an action to be
         executed.
+
+        Counts the unsatisfied goals with one bit count against the precompiled
+        goal mask, which is cheaper than a heuristic_cache lookup.
+        '''
+        if self.goal_mask is None:
+            return float("inf")
+        return bin(self.goal_mask & ~self.state_to_bits(node.state)).count('1')
+
+    def h_ignore_preconditions_cover(self, node: Node):
+        '''
+        Ignore preconditions heuristic as a set cover problem: the smallest number
+        of actions whose add effects together contain all unsatisfied goals (see
+        Russell-Norvig Ed-3 10.2.3). Admissible and at least h_ignore_preconditions;
+        the two are equal when no action adds more than one goal, as in the air
+        cargo domain.
         '''
-        # TODO implement (see Russell-Norvig Ed-3 10.2.3  or Russell-Norvig Ed-2 11.2)
-        count = 0
-        goal_tf = encode_state(FluentState(self.goal,[]),self.state_map)
+        if self.goal_mask is None:
+            return float("inf")
+        return self.min_goal_cover(self.goal_mask & ~self.state_to_bits(node.state))
 
-        for ii in range(len(goal_tf)):
-            if goal_tf[ii] == 'T' and node.state[ii] == 'F':
-                count = count + 1
+    def h_pdb(self, node: Node):
+        '''
+        Pattern database heuristic: the sum of the abstract goal distances of
+        disjoint groups of cargos, looked up in precomputed tables (see
+        pattern_databases.py). The first group also tracks all planes and
+        counts their Fly actions. Admissible. The databases are built on first use;
+        set `pattern_databases` to use others, e.g. loaded from disk with
+        PatternDatabaseHeuristic.load.
+        '''
+        if self.pattern_databases is None:
+            self.pattern_databases = PatternDatabaseHeuristic.build(self)
+        return self.pattern_databases.value(self.state_to_bits(node.state))
+
+    def goal_covers(self) -> list:
+        """ Distinct nonempty sets of goals added by one action, as bit masks
+
+        Sets contained in the set of another action are left out, since a cover
+        never needs them.
 
-        return count
+        :return: list of int
+        """
+        if self.goal_mask is None:
+            return []
+        masks = {m.add & self.goal_mask for m in self.action_masks if m is not None} - {0}
+        return sorted(m for m in masks if not any(m != other and m & other == m for other in masks))
+
+    def min_goal_cover(self, goals: int):
+        """ Smallest number of goal_covers whose union contains a set of goals
+
+        Exact search, branching on the actions that add the lowest missing goal; the
+        results are memoized in `goal_cover_costs` by goal set, a HeuristicCache that
+        keeps the 2**16 most recently used sets.
+
+        Set cover is NP-hard: for n goals the search visits up to 2**n goal sets, each
+        branching on every cover of its lowest goal. When no action adds more than one
+        goal (air cargo) every branch removes a single goal, so the search is linear
+        in n and the result is the number of goals, as h_ignore_preconditions returns
+        directly.
+
+        :param goals: int, bit mask of goals
+        :return: int, or inf if a goal is added by no action
+        """
+        if not goals:
+            return 0
+        if self.goal_cover_costs is None:
+            self.goal_cover_costs = HeuristicCache()
+            self.goal_cover_masks = self.goal_covers()
+        key = ('min_goal_cover', goals)
+        cost = self.goal_cover_costs.get(key)
+        if cost is None:
+            low = goals & -goals
+            cost = 1 + min((self.min_goal_cover(goals & ~m)
+                            for m in self.goal_cover_masks if m & low), default=float("inf"))
+            self.goal_cover_costs.put(key, cost)
+        return cost
 
 
 def air_cargo_p1() -> AirCargoProblem:
@@ -331,3 +660,49 @@ def air_cargo_p3() -> AirCargoProblem:
             ]
 
     return AirCargoProblem(cargos, planes, airports, init, goal)
+
+
+def air_cargo_fluents(cargos, planes, airports) -> list:
+    """ All fluents of an air cargo problem: At(c, a), At(p, a) and In(c, p)
+
+    :param cargos: list of str
+    :param planes: list of str
+    :param airports: list of str
+    :return: list of expr
+    """
+    symbols = {name: Expr(name) for name in cargos + planes + airports}
+    fluents = [Expr('At', symbols[x], symbols[a]) for x in cargos + planes for a in airports]
+    fluents += [Expr('In', symbols[c], symbols[p]) for c in cargos for p in planes]
+    return fluents
+
+
+def air_cargo_generated(n_cargos, m_planes, k_airports, seed=0) -> AirCargoProblem:
+    """ Random air cargo problem of a given size
+
+    Cargos C1..Cn and planes P1..Pm start at random airports A1..Ak; the goal
+    moves every cargo to a random airport other than its start (if k > 1). The
+    negative fluents of the initial state are all fluents that are not positive.
+
+    :param n_cargos: int
+    :param m_planes: int
+    :param k_airports: int
+    :param seed: int
+        seed of the random placement, the same seed gives the same problem
+    :return: AirCargoProblem
+    """
+    rng = random.Random(seed)
+    cargos = ['C{}'.format(ii + 1) for ii in range(n_cargos)]
+    planes = ['P{}'.format(ii + 1) for ii in range(m_planes)]
+    airports = ['A{}'.format(ii + 1) for ii in range(k_airports)]
+    symbols = {name: Expr(name) for name in cargos + planes + airports}
+
+    start = {x: rng.choice(airports) for x in cargos + planes}
+    pos = [Expr('At', symbols[x], symbols[start[x]]) for x in cargos + planes]
+    goal = []
+    for c in cargos:
+        destinations = [a for a in airports if a != start[c]] or airports
+        goal.append(Expr('At', symbols[c], symbols[rng.choice(destinations)]))
+
+    positive = set(pos)
+    neg = [f for f in air_cargo_fluents(cargos, planes, airports) if f not in positive]
+    return AirCargoProblem(cargos, planes, airports, FluentState(pos, neg), goal)
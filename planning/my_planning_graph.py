@@ -1,9 +1,25 @@
+import weakref
+
 from aimacode.planning import Action
 from aimacode.search import Problem
 from aimacode.utils import expr
 from lp_utils import decode_state
 
 
+def bit_indices(mask: int) -> list:
+    ''' indices of the set bits of a bit row
+
+    :param mask: int
+    :return: list of int
+    '''
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
 class PgNode():
     ''' Base class for planning graph nodes.
 
@@ -11,12 +27,32 @@ class PgNode():
     parents: the set of nodes in the previous level
     children: the set of nodes in the subsequent level
     mutex: the set of sibling nodes that are mutually exclusive with this node
+    id: index of the literal or action of the node in the planning graph tables
+        (None for nodes created outside of a planning graph)
+    mutex_bits: mutex relations computed by the planning graph, as a bit row
+        indexed by the id of the siblings
+    siblings: dict from id to node of the level, used to resolve mutex_bits
     '''
 
     def __init__(self):
         self.parents = set()
         self.children = set()
-        self.mutex = set()
+        self._mutex = set()
+        self.id = None
+        self.mutex_bits = 0
+        self.siblings = None
+
+    @property
+    def mutex(self):
+        ''' set of sibling nodes that are mutually exclusive with this node
+
+        Mutexes computed by the planning graph are only kept as bits; they are
+        added to the set the first time it is accessed.
+        '''
+        if self.siblings is not None:
+            self._mutex.update(self.siblings[ii] for ii in bit_indices(self.mutex_bits))
+            self.siblings = None
+        return self._mutex
 
     def is_mutex(self, other) -> bool:
         ''' Boolean test for mutual exclusion
@@ -26,7 +62,10 @@ class PgNode():
         :return: bool
             True if this node and the other are marked mutually exclusive (mutex)
         '''
-        if other in self.mutex:
+        if self.siblings is not None and other.id is not None \
+                and self.mutex_bits >> other.id & 1 and self.siblings.get(other.id) is other:
+            return True
+        if other in self._mutex:
             return True
         return False
 
@@ -86,6 +125,19 @@ class PgNode_s(PgNode):
         print("\n*** {}".format(self.literal))
         PgNode.show(self)
 
+    def copy(self):
+        '''new unconnected node for the same literal, without parsing the literal again
+
+        :return: PgNode_s
+        '''
+        node = PgNode_s.__new__(PgNode_s)
+        PgNode.__init__(node)
+        node.symbol = self.symbol
+        node.is_pos = self.is_pos
+        node.literal = self.literal
+        node.id = self.id
+        return node
+
     def __eq__(self, other):
         '''equality test for nodes - compares only the literal for equality
 
@@ -138,6 +190,20 @@ class PgNode_a(PgNode):
         print("\n*** {}{}".format(self.action.name, self.action.args))
         PgNode.show(self)
 
+    def copy(self):
+        '''new unconnected node for the same action, sharing prenodes and effnodes
+
+        :return: PgNode_a
+        '''
+        node = PgNode_a.__new__(PgNode_a)
+        PgNode.__init__(node)
+        node.action = self.action
+        node.prenodes = self.prenodes
+        node.effnodes = self.effnodes
+        node.is_persistent = self.is_persistent
+        node.id = self.id
+        return node
+
     def precond_s_nodes(self):
         '''precondition literals as S-nodes (represents possible parents for this node).
         It is computationally expensive to call this function; it is only called by the
@@ -198,31 +264,124 @@ def mutexify(node1: PgNode, node2: PgNode):
     node2.mutex.add(node1)
 
 
-class PlanningGraph():
+def set_mutex_rows(nodes: dict, rows: dict):
+    ''' stores bit rows of mutex relations in sibling nodes
+
+    :param nodes: dict from id to PgNode of one level
+    :param rows: dict from id to int, the mutex row of each node (missing ids have no mutexes)
+    :return:
+        mutex_bits and siblings of the nodes modified
     '''
-    A planning graph as described in chapter 10 of the AIMA text. The planning
-    graph can be used to reason about 
+    for ii, node in nodes.items():
+        node.mutex_bits = rows.get(ii, 0)
+        node.siblings = nodes
+
+
+def has_ids(nodes) -> bool:
+    ''' test whether sibling nodes and their parents all have ids, i.e. were created by a planning graph
+
+    :param nodes: iterable of PgNode
+    :return: bool
+    '''
+    return all(n.id is not None and all(p.id is not None for p in n.parents) for n in nodes)
+
+
+class PlanningGraphSkeleton():
+    '''
+    The parts of a planning graph that only depend on the problem and not on
+    the state the graph is built from. Skeletons are built once per problem
+    and shared by all of its planning graphs, see PlanningGraphSkeleton.of.
+
+    Literals and actions are numbered: literal ids are 2 * i for the positive
+    and 2 * i + 1 for the negative literal of fluent i, so the negation of a
+    literal id is id ^ 1, and action ids are indices into all_actions. The
+    inconsistent effects and interference tests do not depend on the level;
+    they are tabulated in static_mutex.
+
+    Args:
+    ----------
+    problem : PlanningProblem (or subclass such as AirCargoProblem or HaveCakeProblem)
     '''
 
-    def __init__(self, problem: Problem, state: str, serial_planning=True):
+    # skeletons by problem, see PlanningGraphSkeleton.of
+    _cache = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def of(cls, problem: Problem):
+        ''' the skeleton of a problem, built on first use
+
+        A new skeleton is built if the actions_list of the problem was replaced.
+
+        :param problem: PlanningProblem
+        :return: PlanningGraphSkeleton
         '''
-        :param problem: PlanningProblem (or subclass such as AirCargoProblem or HaveCakeProblem)
-        :param state: str (will be in form TFTTFF... representing fluent states)
-        :param serial_planning: bool (whether or not to assume that only one action can occur at a time)
-        Instance variable calculated:
-            fs: FluentState
-                the state represented as positive and negative fluent literal lists
+        skeleton = cls._cache.get(problem)
+        if skeleton is None or skeleton.actions_list is not problem.actions_list:
+            skeleton = cls._cache[problem] = cls(problem)
+        return skeleton
+
+    def __init__(self, problem: Problem):
+        '''
+        Instance variables calculated:
             all_actions: list of the PlanningProblem valid ground actions combined with calculated no-op actions
-            s_levels: list of sets of PgNode_s, where each set in the list represents an S-level in the planning graph
-            a_levels: list of sets of PgNode_a, where each set in the list represents an A-level in the planning graph
+            fluents: list of fluent expr by fluent index; fluent_ids is its inverse
+            preconditions, effects: list (by action id) of lists of literal ids
+            pre_masks, eff_masks: list (by action id) of bit rows of the same literals
+            producers, consumers: dict from literal id to bit row of the actions
+                that have the literal as effect or precondition
+            static_mutex: list (by action id) of bit rows of the actions with
+                inconsistent effects or interference
+            serial_mask: bit row of the non-persistent actions
+            action_templates: list (by action id) of PgNode_a that are copied into the levels
+            literal_templates: dict from literal id to PgNode_s that are copied into the levels
         '''
-        self.problem = problem
-        self.fs = decode_state(state, problem.state_map)
-        self.serial = serial_planning
-        self.all_actions = self.problem.actions_list + self.noop_actions(self.problem.state_map)
-        self.s_levels = []
-        self.a_levels = []
-        self.create_graph()
+        self.state_map = problem.state_map
+        self.actions_list = problem.actions_list
+        self.all_actions = problem.actions_list + self.noop_actions(problem.state_map)
+        self.fluents = list(problem.state_map)
+        self.fluent_ids = {fluent: ii for ii, fluent in enumerate(self.fluents)}
+        self.preconditions = []
+        self.effects = []
+        self.pre_masks = []
+        self.eff_masks = []
+        self.producers = {}
+        self.consumers = {}
+        self.serial_mask = 0
+        self.action_templates = []
+        self.literal_templates = {}
+        for a_id, action in enumerate(self.all_actions):
+            pre = [self.literal_id(p, True) for p in action.precond_pos] + \
+                  [self.literal_id(p, False) for p in action.precond_neg]
+            eff = [self.literal_id(e, True) for e in action.effect_add] + \
+                  [self.literal_id(e, False) for e in action.effect_rem]
+            self.preconditions.append(pre)
+            self.effects.append(eff)
+            self.pre_masks.append(sum(1 << l_id for l_id in set(pre)))
+            self.eff_masks.append(sum(1 << l_id for l_id in set(eff)))
+            for l_id in pre:
+                self.consumers[l_id] = self.consumers.get(l_id, 0) | 1 << a_id
+            for l_id in eff:
+                self.producers[l_id] = self.producers.get(l_id, 0) | 1 << a_id
+            if set(pre) != set(eff):
+                self.serial_mask |= 1 << a_id
+
+            template = PgNode_a(action)
+            template.id = a_id
+            for s in template.prenodes | template.effnodes:
+                s.id = self.literal_id(s.symbol, s.is_pos)
+                self.literal_templates.setdefault(s.id, s)
+            self.action_templates.append(template)
+
+        # inconsistent effects: an effect of one action negates an effect of the other
+        # interference: an effect of one action negates a precondition of the other
+        self.static_mutex = []
+        for a_id in range(len(self.all_actions)):
+            row = 0
+            for l_id in self.effects[a_id]:
+                row |= self.producers.get(l_id ^ 1, 0) | self.consumers.get(l_id ^ 1, 0)
+            for l_id in self.preconditions[a_id]:
+                row |= self.producers.get(l_id ^ 1, 0)
+            self.static_mutex.append(row)
 
     def noop_actions(self, literal_list):
         '''create persistent action for each possible fluent
@@ -253,6 +412,237 @@ class PlanningGraph():
             action_list.append(act2)
         return action_list
 
+    def literal_id(self, symbol, is_pos: bool) -> int:
+        ''' id of a literal, numbering fluents outside of the state map as they are seen
+
+        :param symbol: expr
+        :param is_pos: bool
+        :return: int
+        '''
+        fluent_id = self.fluent_ids.get(symbol)
+        if fluent_id is None:
+            fluent_id = self.fluent_ids[symbol] = len(self.fluents)
+            self.fluents.append(symbol)
+        return 2 * fluent_id + (0 if is_pos else 1)
+
+    def literal_node(self, l_id: int) -> PgNode_s:
+        ''' new S-node for a literal, copied from its template
+
+        :param l_id: int
+        :return: PgNode_s
+        '''
+        if l_id not in self.literal_templates:
+            template = PgNode_s(self.fluents[l_id >> 1], not l_id & 1)
+            template.id = l_id
+            self.literal_templates[l_id] = template
+        return self.literal_templates[l_id].copy()
+
+    def state_mask(self, state) -> int:
+        ''' bit row of the literals that hold in a state
+
+        :param state: str (TFTTFF... over the state map) or int (bit i set if fluent i holds)
+        :return: int
+        '''
+        mask = 0
+        if isinstance(state, int):
+            for ii in range(len(self.state_map)):
+                mask |= 1 << (2 * ii + (0 if state >> ii & 1 else 1))
+        else:
+            for ii, value in enumerate(state):
+                mask |= 1 << (2 * ii + (0 if value == 'T' else 1))
+        return mask
+
+    def action_mutex_rows(self, a_mask: int, s_rows: dict, serial: bool) -> dict:
+        ''' mutex rows of the actions of an A-level
+
+        The row of an action is the union of its static_mutex row, the
+        serial_mask and the consumers of the literals that are mutex with one of
+        its preconditions (competing needs), restricted to the actions of the
+        level.
+
+        :param a_mask: int, the actions of the level
+        :param s_rows: dict from literal id to mutex row in the preceding S-level
+        :param serial: bool, whether non-persistent actions are pairwise mutex
+        :return: dict from action id to mutex row
+        '''
+        # actions with a precondition that is mutex with a given literal
+        competing = {}
+        for l_id, row in s_rows.items():
+            if row:
+                consumers = 0
+                for other in bit_indices(row):
+                    consumers |= self.consumers.get(other, 0)
+                competing[l_id] = consumers
+
+        rows = {}
+        for a_id in bit_indices(a_mask):
+            row = self.static_mutex[a_id]
+            if serial and self.serial_mask >> a_id & 1:
+                row |= self.serial_mask
+            for l_id in self.preconditions[a_id]:
+                row |= competing.get(l_id, 0)
+            rows[a_id] = row & a_mask & ~(1 << a_id)
+        return rows
+
+    def literal_mutex_rows(self, s_mask: int, a_mask: int, a_rows: dict) -> dict:
+        ''' mutex rows of the literals of an S-level
+
+        For each literal, the actions that are not mutex with one of its
+        achievers are collected in a bit row; every literal with no achiever in
+        that row lacks consistent support. A literal is always mutex with its
+        negation.
+
+        :param s_mask: int, the literals of the level
+        :param a_mask: int, the actions of the preceding A-level
+        :param a_rows: dict from action id to mutex row in the preceding A-level
+        :return: dict from literal id to mutex row
+        '''
+        achievers = {l_id: self.producers.get(l_id, 0) & a_mask for l_id in bit_indices(s_mask)}
+        rows = {}
+        for l_id, achiever_row in achievers.items():
+            compatible = 0
+            for a_id in bit_indices(achiever_row):
+                compatible |= a_mask & ~a_rows[a_id]
+            supported = 0
+            for other, other_row in achievers.items():
+                if other_row & compatible:
+                    supported |= 1 << other
+            rows[l_id] = (s_mask & ~supported | 1 << (l_id ^ 1)) & s_mask & ~(1 << l_id)
+        return rows
+
+
+class PlanningGraph():
+    '''
+    A planning graph as described in chapter 10 of the AIMA text. The planning
+    graph can be used to reason about 
+
+    The levels are built as bit rows over the literal and action ids of the
+    PlanningGraphSkeleton of the problem; s_masks and a_masks hold the
+    literals and actions of each level and s_mutex and a_mutex their mutex
+    rows. The PgNode objects of s_levels and a_levels are only created when
+    one of these attributes is first accessed; the heuristics do not need them.
+
+    A goal directed graph stops expanding at the first level that contains
+    all goal literals instead of expanding until it levels off. That is all
+    h_levelsum and h_maxlevel need; h_setlevel expands the graph further if
+    the goals are still mutex at that level.
+    '''
+
+    def __init__(self, problem: Problem, state: str, serial_planning=True, goal_directed=False):
+        '''
+        :param problem: PlanningProblem (or subclass such as AirCargoProblem or HaveCakeProblem)
+        :param state: str (will be in form TFTTFF... representing fluent states), or int bit mask
+        :param serial_planning: bool (whether or not to assume that only one action can occur at a time)
+        :param goal_directed: bool (whether to stop expanding once all goals of the problem appeared)
+        Instance variable calculated:
+            skeleton: PlanningGraphSkeleton of the problem
+            all_actions: list of the PlanningProblem valid ground actions combined with calculated no-op actions
+            goal_ids: list of the literal ids of the goals, None if a goal is not a known fluent
+            goal_mask: bit row of goal_ids
+            s_masks, a_masks: list of bit rows of the literal or action ids in each level
+            s_mutex, a_mutex: list of dicts from literal or action id to its mutex row in each level
+        Instance variables computed on first access:
+            fs: FluentState
+                the state represented as positive and negative fluent literal lists
+            s_levels: list of sets of PgNode_s, where each set in the list represents an S-level in the planning graph
+            a_levels: list of sets of PgNode_a, where each set in the list represents an A-level in the planning graph
+            s_nodes, a_nodes: the same levels as dicts from literal or action id to node
+        '''
+        self.problem = problem
+        self.state = state
+        self.serial = serial_planning
+        self.goal_directed = goal_directed
+        self.skeleton = PlanningGraphSkeleton.of(problem)
+        self.all_actions = self.skeleton.all_actions
+        self.goal_ids = []
+        for g in problem.goal:
+            fluent_id = self.skeleton.fluent_ids.get(g)
+            if fluent_id is None:
+                self.goal_ids = None
+                break
+            self.goal_ids.append(2 * fluent_id)
+        self.goal_mask = sum(1 << l_id for l_id in set(self.goal_ids or []))
+        self.s_masks = []
+        self.a_masks = []
+        self.s_mutex = []
+        self.a_mutex = []
+        self._nodes = None
+        self._levels = None
+        self.create_graph()
+
+    @property
+    def fs(self):
+        state = self.state
+        if isinstance(state, int):
+            state = ''.join('T' if state >> ii & 1 else 'F' for ii in range(len(self.problem.state_map)))
+        return decode_state(state, self.problem.state_map)
+
+    @property
+    def s_levels(self):
+        return self.level_sets()[0]
+
+    @property
+    def a_levels(self):
+        return self.level_sets()[1]
+
+    @property
+    def s_nodes(self):
+        return self.node_levels()[0]
+
+    @property
+    def a_nodes(self):
+        return self.node_levels()[1]
+
+    def node_levels(self):
+        ''' create the PgNode objects of all levels, connected and with their mutexes
+
+        The nodes are created once; later calls return the same nodes.
+
+        :return: (list, list)
+            dicts from id to node of the S-levels and of the A-levels
+        '''
+        if self._nodes is not None:
+            return self._nodes
+        skeleton = self.skeleton
+        s_nodes = []
+        a_nodes = []
+        for level, s_mask in enumerate(self.s_masks):
+            literals = {l_id: skeleton.literal_node(l_id) for l_id in bit_indices(s_mask)}
+            if level > 0:
+                for a_id, a in a_nodes[level - 1].items():
+                    for l_id in skeleton.effects[a_id]:
+                        a.children.add(literals[l_id])
+                        literals[l_id].parents.add(a)
+            set_mutex_rows(literals, self.s_mutex[level])
+            s_nodes.append(literals)
+
+            if level < len(self.a_masks):
+                actions = {}
+                for a_id in bit_indices(self.a_masks[level]):
+                    node = skeleton.action_templates[a_id].copy()
+                    node.parents = {literals[l_id] for l_id in skeleton.preconditions[a_id]}
+                    for s in node.parents:
+                        s.children.add(node)
+                    actions[a_id] = node
+                set_mutex_rows(actions, self.a_mutex[level])
+                a_nodes.append(actions)
+        self._nodes = (s_nodes, a_nodes)
+        return self._nodes
+
+    def level_sets(self):
+        ''' the levels of node_levels() as sets of nodes
+
+        The sets are created once, like the nodes, until the graph is expanded.
+
+        :return: (list, list)
+            sets of PgNode_s of the S-levels and sets of PgNode_a of the A-levels
+        '''
+        if self._levels is None:
+            s_nodes, a_nodes = self.node_levels()
+            self._levels = ([set(nodes.values()) for nodes in s_nodes],
+                            [set(nodes.values()) for nodes in a_nodes])
+        return self._levels
+
     def create_graph(self):
         ''' build a Planning Graph as described in Russell-Norvig 3rd Ed 10.3 or 2nd Ed 11.4
 
@@ -264,108 +654,126 @@ class PlanningGraph():
         This function should only be called by the class constructor.
 
         :return:
-            builds the graph by filling s_levels[] and a_levels[] lists with node sets for each level
+            builds the graph by filling s_masks[], a_masks[], s_mutex[] and a_mutex[] for each level
         '''
         # the graph should only be built during class construction
-        if (len(self.s_levels) != 0) or (len(self.a_levels) != 0):
+        if (len(self.s_masks) != 0) or (len(self.a_masks) != 0):
             raise Exception(
                 'Planning Graph already created; construct a new planning graph for each new state in the planning sequence')
 
         # initialize S0 to literals in initial state provided.
-        leveled = False
-        level = 0
-        self.s_levels.append(set())  # S0 set of s_nodes - empty to start
-        # for each fluent in the initial state, add the correct literal PgNode_s
-        for literal in self.fs.pos:
-            self.s_levels[level].add(PgNode_s(literal, True))
-        for literal in self.fs.neg:
-            self.s_levels[level].add(PgNode_s(literal, False))
+        self.s_masks.append(self.skeleton.state_mask(self.state))
         # no mutexes at the first level
+        self.s_mutex.append({})
 
-        # continue to build the graph alternating A, S levels until last two S levels contain the same literals,
-        # i.e. until it is "leveled"
-        while not leveled:
-            self.add_action_level(level)
-            self.update_a_mutex(self.a_levels[level])
+        self.expand(self.goals_appeared if self.goal_directed else None)
 
-            level += 1
-            self.add_literal_level(level)
-            self.update_s_mutex(self.s_levels[level])
+    def expand(self, stop=None, mutexes=False):
+        ''' add A and S levels until the graph levels off or stop(level) holds for the last S-level
 
-            if self.s_levels[level] == self.s_levels[level - 1]:
-                leveled = True
+        The graph is "leveled" when the last two S levels contain the same literals (and, if
+        `mutexes` is set, the same mutexes). Node views created before are discarded.
 
-    def add_action_level(self, level):
-        ''' add an A (action) level to the Planning Graph
+        :param stop: function taking an S-level index and returning bool, or None
+        :param mutexes: bool (whether the graph only levels off once the mutexes stop changing)
+        :return:
+            levels appended to s_masks[], a_masks[], s_mutex[] and a_mutex[]
+        '''
+        level = len(self.s_masks) - 1
+        while not (stop is not None and stop(level)) and not self.is_leveled(level, mutexes):
+            level = self.add_level()
+
+    def add_level(self) -> int:
+        ''' add an A level and the following S level, with their mutexes, to the graph
+
+        :return: int, the index of the new S-level
+        '''
+        level = len(self.s_masks) - 1
+        self.add_action_level(level)
+        self.a_mutex.append(self.skeleton.action_mutex_rows(
+            self.a_masks[level], self.s_mutex[level], self.serial))
+
+        level += 1
+        self.add_literal_level(level)
+        self.s_mutex.append(self.skeleton.literal_mutex_rows(
+            self.s_masks[level], self.a_masks[level - 1], self.a_mutex[level - 1]))
+        self._nodes = None
+        self._levels = None
+        return level
+
+    def is_leveled(self, level: int, mutexes=False) -> bool:
+        ''' test whether S-level `level` repeats the previous one
 
         :param level: int
-            the level number alternates S0, A0, S1, A1, S2, .... etc the level number is also used as the
-            index for the node set lists self.a_levels[] and self.s_levels[]
-        :return:
-            adds A nodes to the current level in self.a_levels[level]
+        :param mutexes: bool (whether the mutexes have to repeat as well)
+        :return: bool
         '''
-        # TODO add action A level to the planning graph as described in the Russell-Norvig text
-        # 1. determine what actions to add and create those PgNode_a objects
-        # 2. connect the nodes to the previous S literal level
-        # for example, the A0 level will iterate through all possible actions for the problem and add a PgNode_a to a_levels[0]
-        #   set iff all prerequisite literals for the action hold in S0.  This can be accomplished by testing
-        #   to see if a proposed PgNode_a has prenodes that are a subset of the previous S level.  Once an
-        #   action node is added, it MUST be connected to the S node instances in the appropriate s_level set.
+        if level == 0 or self.s_masks[level] != self.s_masks[level - 1]:
+            return False
+        return not mutexes or self.s_mutex[level] == self.s_mutex[level - 1]
 
-        self.a_levels.append(set())
+    def goals_appeared(self, level: int) -> bool:
+        ''' test whether all goal literals are in an S-level
 
-        for a in self.all_actions:
-            node = PgNode_a(a)
-            parents = set()
+        :param level: int
+        :return: bool
+        '''
+        return self.goal_ids is not None and not self.goal_mask & ~self.s_masks[level]
 
-            satisfiable = [ False for n in range(len(node.prenodes)) ]
-            ii = 0
-            for p in node.prenodes:
-                for s in self.s_levels[level]:
-                    if p == s:
-                        satisfiable[ii] = True
-                        parents.add(s)
-                        break
-                ii = ii+1
-            if all(satisfiable):
-                self.a_levels[level].add(node)
-                node.parents = parents
+    def goals_compatible(self, level: int) -> bool:
+        ''' test whether all goal literals are in an S-level and pairwise not mutex
 
+        :param level: int
+        :return: bool
+        '''
+        if not self.goals_appeared(level):
+            return False
+        rows = self.s_mutex[level]
+        return not any(rows.get(l_id, 0) & self.goal_mask for l_id in self.goal_ids)
 
+    def add_action_level(self, level):
+        ''' add an A (action) level to the Planning Graph
 
+        An action is added iff all of its preconditions are in the preceding S-level. Only the
+        consumers of literals that are new in this level can become applicable; the actions of the
+        previous level are checked again since literals without no-ops may disappear.
+
+        :param level: int
+            the level number alternates S0, A0, S1, A1, S2, .... etc the level number is also used as the
+            index for the lists self.a_masks[] and self.s_masks[]
+        :return:
+            adds the bit row of the actions of the level to self.a_masks
+        '''
+        skeleton = self.skeleton
+        s_mask = self.s_masks[level]
+        if level == 0:
+            candidates = (1 << len(self.all_actions)) - 1
+        else:
+            candidates = self.a_masks[level - 1]
+            for l_id in bit_indices(s_mask & ~self.s_masks[level - 1]):
+                candidates |= skeleton.consumers.get(l_id, 0)
+
+        a_mask = 0
+        for a_id in bit_indices(candidates):
+            if not skeleton.pre_masks[a_id] & ~s_mask:
+                a_mask |= 1 << a_id
+        self.a_masks.append(a_mask)
 
     def add_literal_level(self, level):
         ''' add an S (literal) level to the Planning Graph
 
+        The literals of the level are the effects of the actions of the previous A-level.
+
         :param level: int
             the level number alternates S0, A0, S1, A1, S2, .... etc the level number is also used as the
-            index for the node set lists self.a_levels[] and self.s_levels[]
+            index for the lists self.a_masks[] and self.s_masks[]
         :return:
-            adds S nodes to the current level in self.s_levels[level]
-        '''
-        # TODO add literal S level to the planning graph as described in the Russell-Norvig text
-        # 1. determine what literals to add
-        # 2. connect the nodes
-        # for example, every A node in the previous level has a list of S nodes in effnodes that represent the effect
-        #   produced by the action.  These literals will all be part of the new S level.  Since we are working with sets, they
-        #   may be "added" to the set without fear of duplication.  However, it is important to then correctly create and connect
-        #   all of the new S nodes as children of all the A nodes that could produce them, and likewise add the A nodes to the
-        #   parent sets of the S nodes
-
-        self.s_levels.append(set())
-
-        for a in self.a_levels[level-1]:
-            for p in a.action.effect_add:
-                self.s_levels[level].add(PgNode_s(p,True))
-            for n in a.action.effect_rem:
-                self.s_levels[level].add(PgNode_s(n,False))
-
-        for a in self.a_levels[level-1]:
-            children = set()
-            for s in self.s_levels[level]:
-                if s in a.effnodes:
-                    children.add(s)
-            a.children = children
+            adds the bit row of the literals of the level to self.s_masks
+        '''
+        s_mask = 0
+        for a_id in bit_indices(self.a_masks[level - 1]):
+            s_mask |= self.skeleton.eff_masks[a_id]
+        self.s_masks.append(s_mask)
 
     def update_a_mutex(self, nodeset):
         ''' Determine and update sibling mutual exclusion for A-level nodes
@@ -378,18 +786,28 @@ class PlanningGraph():
            Interference
            Competing needs
 
+        The graph itself computes the mutexes with PlanningGraphSkeleton.action_mutex_rows;
+        this method applies the same computation to a set of connected nodes. Nodes
+        created outside of a planning graph have no id and are tested pairwise.
+
         :param nodeset: set of PgNode_a (siblings in the same level)
         :return:
             mutex set in each PgNode_a in the set is appropriately updated
         '''
-        nodelist = list(nodeset)
-        for i, n1 in enumerate(nodelist[:-1]):
-            for n2 in nodelist[i + 1:]:
-                if (self.serialize_actions(n1, n2) or
-                        self.inconsistent_effects_mutex(n1, n2) or
-                        self.interference_mutex(n1, n2) or
-                        self.competing_needs_mutex(n1, n2)):
-                    mutexify(n1, n2)
+        if not has_ids(nodeset):
+            nodelist = list(nodeset)
+            for i, n1 in enumerate(nodelist[:-1]):
+                for n2 in nodelist[i + 1:]:
+                    if (self.serialize_actions(n1, n2) or
+                            self.inconsistent_effects_mutex(n1, n2) or
+                            self.interference_mutex(n1, n2) or
+                            self.competing_needs_mutex(n1, n2)):
+                        mutexify(n1, n2)
+            return
+        nodes = {n.id: n for n in nodeset}
+        s_rows = {s.id: s.mutex_bits for n in nodeset for s in n.parents}
+        rows = self.skeleton.action_mutex_rows(sum(1 << a_id for a_id in nodes), s_rows, self.serial)
+        set_mutex_rows(nodes, rows)
 
     def serialize_actions(self, node_a1: PgNode_a, node_a2: PgNode_a) -> bool:
         '''
@@ -487,15 +905,26 @@ class PlanningGraph():
            Negation
            Inconsistent support
 
-        :param nodeset: set of PgNode_a (siblings in the same level)
+        The graph itself computes the mutexes with PlanningGraphSkeleton.literal_mutex_rows;
+        this method applies the same computation to a set of connected nodes. Nodes
+        created outside of a planning graph have no id and are tested pairwise.
+
+        :param nodeset: set of PgNode_s (siblings in the same level)
         :return:
-            mutex set in each PgNode_a in the set is appropriately updated
+            mutex set in each PgNode_s in the set is appropriately updated
         '''
-        nodelist = list(nodeset)
-        for i, n1 in enumerate(nodelist[:-1]):
-            for n2 in nodelist[i + 1:]:
-                if self.negation_mutex(n1, n2) or self.inconsistent_support_mutex(n1, n2):
-                    mutexify(n1, n2)
+        if not has_ids(nodeset):
+            nodelist = list(nodeset)
+            for i, n1 in enumerate(nodelist[:-1]):
+                for n2 in nodelist[i + 1:]:
+                    if self.negation_mutex(n1, n2) or self.inconsistent_support_mutex(n1, n2):
+                        mutexify(n1, n2)
+            return
+        nodes = {n.id: n for n in nodeset}
+        a_rows = {a.id: a.mutex_bits for n in nodeset for a in n.parents}
+        rows = self.skeleton.literal_mutex_rows(sum(1 << l_id for l_id in nodes),
+                                                sum(1 << a_id for a_id in a_rows), a_rows)
+        set_mutex_rows(nodes, rows)
 
     def negation_mutex(self, node_s1: PgNode_s, node_s2: PgNode_s) -> bool:
         '''
@@ -537,25 +966,175 @@ class PlanningGraph():
 
         return True
 
+    def goal_levels(self):
+        '''The level at which each goal first appears
+
+        :return: list of int, or None if a goal never appears
+        '''
+        if self.goal_ids is None:
+            return None
+        levels = []
+        for l_id in self.goal_ids:
+            bit = 1 << l_id
+            for level, s_mask in enumerate(self.s_masks):
+                if s_mask & bit:
+                    levels.append(level)
+                    break
+            else:
+                return None
+        return levels
+
     def h_levelsum(self) -> int:
         '''The sum of the level costs of the individual goals (admissible if goals independent)
 
         :return: int
         '''
-        level_sum = 0
-        # TODO implement
-        goals = { }
-        for g in self.problem.goal:
-            goals[PgNode_s(g,True)] = -1
-        
-        for ii in range(len(self.s_levels)):
-            for g in goals:
-                if g in self.s_levels[ii] and goals[g] == -1:
-                    goals[g] = ii
-
-        for g in goals:
-            level_sum = level_sum + goals[g]
-            if goals[g] == -1:
-                return float("inf")
-
-        return level_sum
+        levels = self.goal_levels()
+        if levels is None:
+            return float("inf")
+        return sum(levels)
+
+    def h_maxlevel(self) -> int:
+        '''The largest level cost of the individual goals (admissible)
+
+        :return: int
+        '''
+        levels = self.goal_levels()
+        if levels is None:
+            return float("inf")
+        return max(levels, default=0)
+
+    def h_setlevel(self) -> int:
+        '''The first level at which all goals appear and are pairwise not mutex (admissible)
+
+        Expands the graph further if necessary, until the mutexes level off.
+
+        :return: int
+        '''
+        if self.goal_ids is None:
+            return float("inf")
+        self.expand(self.goals_compatible, mutexes=True)
+        for level in range(len(self.s_masks)):
+            if self.goals_compatible(level):
+                return level
+        return float("inf")
+
+    def extract_plan(self, max_levels=None):
+        '''GraphPlan: backward search for a plan, extending the graph one level at a time
+
+        Starting at the first level where the goals are pairwise not mutex, a set of
+        pairwise non-mutex actions of the preceding A-level that achieves the goals is
+        searched; their preconditions are the goals of the level below, down to S0.
+        Goal sets that failed at a level are remembered as no-goods and not tried there
+        again. If the extraction fails the graph is extended by a level. There is no plan
+        if the graph has leveled off and a failed stage did not add a no-good at the
+        level where it leveled off.
+
+        With serial planning every step has one action (plus no-ops), so the plan has
+        the fewest actions; otherwise independent actions share a step and the plan has
+        the fewest steps.
+
+        :param max_levels: int or None (give up when the graph has more S-levels)
+        :return: list of lists of Action (the actions of each step without no-ops), or
+            None if there is no plan
+        '''
+        if self.goal_ids is None:
+            return None
+        self.expand(self.goals_compatible, mutexes=True)
+        level = next((ii for ii in range(len(self.s_masks)) if self.goals_compatible(ii)), None)
+        if level is None:
+            return None
+
+        nogoods = [set() for _ in self.s_masks]
+        leveled = None
+        nogood_count = None
+        while True:
+            steps = self.extract_goals(level, self.goal_mask, nogoods)
+            if steps is not None:
+                n_ground = len(self.problem.actions_list)
+                return [[self.all_actions[a_id] for a_id in bit_indices(a_mask) if a_id < n_ground]
+                        for a_mask in steps]
+
+            if leveled is None and self.is_leveled(level, mutexes=True):
+                leveled = level - 1
+            if leveled is not None:
+                if nogood_count == len(nogoods[leveled]):
+                    return None
+                nogood_count = len(nogoods[leveled])
+            if max_levels is not None and level + 1 >= max_levels:
+                return None
+            level += 1
+            if level == len(self.s_masks):
+                self.add_level()
+                nogoods.append(set())
+
+    def extract_goals(self, level: int, goals: int, nogoods: list):
+        '''actions achieving a set of literals of an S-level from S0
+
+        :param level: int
+        :param goals: int, bit row of literal ids of the S-level
+        :param nogoods: list (by level) of sets of goal rows known to fail
+        :return: list of action rows, one per A-level below the S-level, or None
+        '''
+        if level == 0:
+            return []
+        if goals in nogoods[level]:
+            return None
+        producers = self.skeleton.producers
+        a_mask = self.a_masks[level - 1]
+        # goals with the fewest achievers first
+        ordered = sorted(bit_indices(goals), key=lambda l_id: bin(producers.get(l_id, 0) & a_mask).count('1'))
+        steps = self.assign_achievers(level, ordered, 0, 0, 0, nogoods)
+        if steps is None:
+            nogoods[level].add(goals)
+        return steps
+
+    def assign_achievers(self, level: int, goals: list, ii: int, chosen: int, excluded: int, nogoods: list):
+        '''choose pairwise non-mutex achievers for goals[ii:] in the A-level below an S-level
+
+        No-ops (which have the highest ids) are tried first. Once every goal has an
+        achiever, the preconditions of the chosen actions are extracted one level down.
+
+        :param level: int, index of the S-level
+        :param goals: list of literal ids
+        :param ii: int, index of the next goal in goals
+        :param chosen: int, bit row of the actions chosen so far
+        :param excluded: int, bit row of the actions mutex with one of the chosen actions
+        :param nogoods: list (by level) of sets of goal rows known to fail
+        :return: list of action rows, one per A-level up to level - 1, or None
+        '''
+        producers = self.skeleton.producers
+        while ii < len(goals) and chosen & producers.get(goals[ii], 0):
+            ii += 1
+        if ii == len(goals):
+            subgoals = 0
+            for a_id in bit_indices(chosen):
+                subgoals |= self.skeleton.pre_masks[a_id]
+            steps = self.extract_goals(level - 1, subgoals, nogoods)
+            if steps is None:
+                return None
+            return steps + [chosen]
+
+        rows = self.a_mutex[level - 1]
+        achievers = producers.get(goals[ii], 0) & self.a_masks[level - 1] & ~excluded
+        for a_id in reversed(bit_indices(achievers)):
+            steps = self.assign_achievers(level, goals, ii + 1, chosen | 1 << a_id,
+                                          excluded | rows[a_id], nogoods)
+            if steps is not None:
+                return steps
+        return None
+
+
+def graphplan(problem: Problem, serial_planning=False, max_levels=None):
+    '''plan with GraphPlan from the initial state of a problem
+
+    :param problem: PlanningProblem (or subclass such as AirCargoProblem or HaveCakeProblem)
+    :param serial_planning: bool (one action per step, for plans with the fewest actions)
+    :param max_levels: int or None (give up when the graph has more S-levels)
+    :return: list of Action, or None if there is no plan
+    '''
+    graph = PlanningGraph(problem, problem.initial, serial_planning, goal_directed=True)
+    steps = graph.extract_plan(max_levels)
+    if steps is None:
+        return None
+    return [action for step in steps for action in step]
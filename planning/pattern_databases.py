@@ -0,0 +1,419 @@
+'''Pattern database heuristics for air cargo problems.
+
+A pattern is a subset of the cargos and planes of a problem. The abstract
+problem only keeps track of the locations of those objects: a cargo is at an
+airport or in any plane, a plane of the pattern is at an airport, and planes
+outside of the pattern are assumed to be wherever they are needed. The
+distance to the goal of every abstract state is computed once by a backward
+0-1 breadth-first search and stored in a NumPy array, so a lookup is an index
+computation over the few fluents of the pattern.
+
+Each abstract distance is a lower bound of the true distance, so the maximum
+over several databases is admissible. Their sum is admissible when every
+action is counted in at most one database: Load and Unload belong to the
+pattern of their cargo, and the Fly actions to the only pattern that tracks
+planes.
+
+Planes only make a pattern more informed if it tracks all of them, since an
+untracked plane is always where it is needed. Patterns without planes know
+nothing about Fly actions: their sum is the closed form goal_count_bound(),
+1 per goal cargo in a plane and 2 per goal cargo at another airport. The
+additive default therefore tracks all planes in the first pattern and none in
+the others (see PatternDatabaseHeuristic.patterns).
+
+The tables can be saved as .npy files and loaded memory-mapped, so that
+worker processes share the same pages. Running this module checks the default
+databases of a problem against goal_count_bound() on sampled states:
+
+    python pattern_databases.py p2 --samples 200
+'''
+import argparse
+import json
+import os
+import random
+import sys
+from collections import deque
+
+import numpy as np
+
+from my_planning_graph import bit_indices
+
+# table entry of abstract states from which the goal cannot be reached
+UNREACHABLE = 255
+
+INF = float("inf")
+
+
+class PatternDatabase():
+    '''
+    Abstract goal distances for the locations of a subset of cargos and planes.
+
+    An abstract state is numbered in mixed radix: one digit per cargo for its
+    location (airport index, or len(airports) + plane index if it is in a
+    plane), followed by one digit per plane of the pattern for its airport.
+
+    Args:
+    ----------
+    problem : AirCargoProblem
+
+    cargos : list of str
+        cargos of the pattern
+
+    planes : list of str
+        planes of the pattern
+
+    fly_cost : int
+        cost of the Fly actions of the planes of the pattern in the abstraction
+
+    table : numpy.ndarray or None
+        precomputed distances (e.g. loaded with PatternDatabase.load); the
+        table is computed if None
+    '''
+
+    def __init__(self, problem, cargos, planes, fly_cost=1, table=None):
+        self.problem = problem
+        self.cargos = list(cargos)
+        self.planes = list(planes)
+        self.fly_cost = fly_cost
+        self.airport_ids = {a: ii for ii, a in enumerate(problem.airports)}
+        self.location_ids = dict(self.airport_ids)
+        self.location_ids.update((p, len(problem.airports) + ii) for ii, p in enumerate(problem.planes))
+        self.cargo_radix = len(self.location_ids)
+        self.plane_radix = len(problem.airports)
+        self.size = self.cargo_radix ** len(self.cargos) * self.plane_radix ** len(self.planes)
+        self.weights = self.fluent_weights()
+        self.mask = sum(1 << f for f in self.weights)
+        self.ground = self.ground_actions()
+
+        if table is None:
+            table = self.solve()
+        elif table.shape != (self.size,):
+            raise ValueError('Pattern database table has shape {}, expected ({},)'.format(
+                table.shape, self.size))
+        self.table = table
+
+    def place_value(self, position: int) -> int:
+        '''weight of a digit of the abstract state number
+
+        :param position: int, index of a cargo of the pattern, or len(cargos) + index of a plane
+        :return: int
+        '''
+        if position < len(self.cargos):
+            return self.cargo_radix ** position
+        return self.cargo_radix ** len(self.cargos) * self.plane_radix ** (position - len(self.cargos))
+
+    def fluent_weights(self) -> dict:
+        '''contribution of each fluent of the pattern to the abstract state number
+
+        :return: dict from the state_map index of the fluent to int
+        '''
+        positions = {c: ii for ii, c in enumerate(self.cargos)}
+        positions.update((p, len(self.cargos) + ii) for ii, p in enumerate(self.planes))
+        weights = {}
+        for ii, fluent in enumerate(self.problem.state_map):
+            obj, place = (str(arg) for arg in fluent.args)
+            if obj not in positions:
+                continue
+            location = self.location_ids[place] if obj in self.cargos else self.airport_ids[place]
+            weights[ii] = location * self.place_value(positions[obj])
+        return weights
+
+    def index(self, bits: int) -> int:
+        '''number of the abstract state of a state
+
+        :param bits: int, state as bit mask
+        :return: int
+        '''
+        weights = self.weights
+        return sum(weights[f] for f in bit_indices(bits & self.mask))
+
+    def value(self, bits: int):
+        '''abstract goal distance of a state
+
+        :param bits: int, state as bit mask
+        :return: int or inf
+        '''
+        value = int(self.table[self.index(bits)])
+        return INF if value == UNREACHABLE else value
+
+    def successors(self, index: int):
+        '''transitions of an abstract state
+
+        :param index: int
+        :return: iterator of (int, int), the successor numbers with the action costs
+        '''
+        n_airports = self.plane_radix
+        ground = self.ground
+        digits = []
+        rest = index
+        for position in range(len(self.cargos) + len(self.planes)):
+            radix = self.cargo_radix if position < len(self.cargos) else self.plane_radix
+            digits.append(rest % radix)
+            rest //= radix
+        plane_at = dict(zip(self.planes, digits[len(self.cargos):]))
+
+        for ii, c in enumerate(self.cargos):
+            location, weight = digits[ii], self.place_value(ii)
+            if location < n_airports:
+                for jj, p in enumerate(self.problem.planes):
+                    if ('Load', c, p, location) in ground and plane_at.get(p, location) == location:
+                        yield index + (n_airports + jj - location) * weight, 1
+            else:
+                p = self.problem.planes[location - n_airports]
+                for a in range(n_airports):
+                    if ('Unload', c, p, a) in ground and plane_at.get(p, a) == a:
+                        yield index + (a - location) * weight, 1
+        for jj, p in enumerate(self.planes):
+            position = len(self.cargos) + jj
+            location, weight = digits[position], self.place_value(position)
+            for a in range(n_airports):
+                if a != location and ('Fly', p, location, a) in ground:
+                    yield index + (a - location) * weight, self.fly_cost
+
+    def ground_actions(self) -> set:
+        '''ground actions of the problem as (name, object, object or airport index, airport index) tuples
+
+        :return: set of tuple
+        '''
+        ground = set()
+        for action in self.problem.actions_list:
+            x, y, z = (str(arg) for arg in action.args)
+            if action.name == 'Fly':
+                ground.add(('Fly', x, self.airport_ids[y], self.airport_ids[z]))
+            else:
+                ground.add((action.name, x, y, self.airport_ids[z]))
+        return ground
+
+    def goal_states(self) -> list:
+        '''numbers of the abstract states that satisfy the goals on the cargos of the pattern
+
+        :return: list of int
+        '''
+        targets = {}
+        for g in self.problem.goal:
+            obj, place = (str(arg) for arg in g.args)
+            if g.op == 'At' and obj in self.cargos:
+                targets[obj] = self.airport_ids[place]
+        states = [0]
+        for position in range(len(self.cargos) + len(self.planes)):
+            if position < len(self.cargos) and self.cargos[position] in targets:
+                values = [targets[self.cargos[position]]]
+            else:
+                values = range(self.cargo_radix if position < len(self.cargos) else self.plane_radix)
+            weight = self.place_value(position)
+            states = [s + v * weight for s in states for v in values]
+        return states
+
+    def solve(self):
+        '''goal distances of all abstract states, by 0-1 breadth-first search backwards from the goals
+
+        :return: numpy.ndarray of uint8
+        '''
+        predecessors = [[] for _ in range(self.size)]
+        for index in range(self.size):
+            for successor, cost in self.successors(index):
+                predecessors[successor].append((index, cost))
+
+        distances = [INF] * self.size
+        queue = deque()
+        for index in self.goal_states():
+            distances[index] = 0
+            queue.append(index)
+        while queue:
+            index = queue.popleft()
+            d = distances[index]
+            for predecessor, cost in predecessors[index]:
+                if d + cost < distances[predecessor]:
+                    distances[predecessor] = d + cost
+                    if cost:
+                        queue.append(predecessor)
+                    else:
+                        queue.appendleft(predecessor)
+        # distances beyond the range of the table are stored as the largest value, a lower bound
+        return np.array([UNREACHABLE if d == INF else min(d, UNREACHABLE - 1) for d in distances],
+                        dtype=np.uint8)
+
+    def save(self, path: str):
+        '''write the table to a .npy file'''
+        np.save(path, self.table)
+
+    @classmethod
+    def load(cls, problem, cargos, planes, fly_cost, path: str, mmap=True):
+        '''pattern database with a table read from a .npy file
+
+        :param mmap: bool (whether to memory-map the file instead of reading it)
+        :return: PatternDatabase
+        '''
+        return cls(problem, cargos, planes, fly_cost, np.load(path, mmap_mode='r' if mmap else None))
+
+
+class PatternDatabaseHeuristic():
+    '''
+    Combination of pattern databases by sum or maximum.
+
+    Args:
+    ----------
+    databases : list of PatternDatabase
+
+    combine : str
+        'add' (admissible if the databases have disjoint cargos and at most one
+        of them tracks planes) or 'max'
+    '''
+
+    def __init__(self, databases: list, combine='add'):
+        if combine not in ('add', 'max'):
+            raise ValueError("combine must be 'add' or 'max', not {!r}".format(combine))
+        self.databases = databases
+        self.combine = combine
+
+    def value(self, bits: int):
+        '''combined abstract goal distance of a state
+
+        :param bits: int, state as bit mask
+        :return: int or inf
+        '''
+        values = (db.value(bits) for db in self.databases)
+        if self.combine == 'add':
+            return sum(values)
+        return max(values, default=0)
+
+    @staticmethod
+    def patterns(problem, cargos_per_pattern=2, max_size=20000, combine='add') -> list:
+        '''disjoint groups of cargos in problem order, with all planes where they fit
+
+        A pattern tracks either all planes or none. With combine='add' only the
+        first pattern tracks planes, so that every Fly action is counted once;
+        with combine='max' every pattern does whose table stays within max_size.
+        If the planes do not fit, the sum equals goal_count_bound().
+
+        :param problem: AirCargoProblem
+        :param cargos_per_pattern: int
+        :param max_size: int, maximum number of abstract states of a pattern
+        :param combine: str, 'add' or 'max'
+        :return: list of (list of str, list of str)
+        '''
+        cargo_radix = len(problem.airports) + len(problem.planes)
+        plane_states = len(problem.airports) ** len(problem.planes)
+        patterns = []
+        for start in range(0, len(problem.cargos), cargos_per_pattern):
+            cargos = problem.cargos[start:start + cargos_per_pattern]
+            track = (combine == 'max' or start == 0) and cargo_radix ** len(cargos) * plane_states <= max_size
+            patterns.append((cargos, list(problem.planes) if track else []))
+        return patterns
+
+    @classmethod
+    def build(cls, problem, combine='add', cargos_per_pattern=2, max_size=20000):
+        '''pattern databases over disjoint cargo groups, see patterns()
+
+        :return: PatternDatabaseHeuristic
+        '''
+        databases = [PatternDatabase(problem, cargos, planes)
+                     for cargos, planes in cls.patterns(problem, cargos_per_pattern, max_size, combine)]
+        return cls(databases, combine)
+
+    @staticmethod
+    def goal_count_bound(problem, bits: int) -> int:
+        '''closed form lower bound: 1 per goal cargo in a plane, 2 per goal cargo at another airport
+
+        This is the sum of pattern databases that track no planes.
+
+        :param problem: AirCargoProblem
+        :param bits: int, state as bit mask
+        :return: int
+        '''
+        bound = 0
+        for g in problem.goal:
+            if g not in problem.state_index:
+                return INF
+            if bits >> problem.state_index[g] & 1:
+                continue
+            cargo = str(g.args[0])
+            loaded = any(bits >> ii & 1 for ii, f in enumerate(problem.state_map)
+                         if f.op == 'In' and str(f.args[0]) == cargo)
+            bound += 1 if loaded else 2
+        return bound
+
+    @staticmethod
+    def signature(problem) -> dict:
+        '''objects and goal of a problem, stored with the tables to check that they fit'''
+        return {'cargos': problem.cargos, 'planes': problem.planes, 'airports': problem.airports,
+                'goal': sorted(str(g) for g in problem.goal)}
+
+    def save(self, directory: str):
+        '''write the tables as .npy files and their patterns to patterns.json in a directory'''
+        os.makedirs(directory, exist_ok=True)
+        patterns = []
+        for ii, db in enumerate(self.databases):
+            filename = 'pdb_{}.npy'.format(ii)
+            db.save(os.path.join(directory, filename))
+            patterns.append({'cargos': db.cargos, 'planes': db.planes, 'fly_cost': db.fly_cost,
+                             'file': filename})
+        with open(os.path.join(directory, 'patterns.json'), 'w') as f:
+            json.dump({'problem': self.signature(self.databases[0].problem) if self.databases else None,
+                       'combine': self.combine, 'patterns': patterns}, f, indent=2)
+
+    @classmethod
+    def load(cls, problem, directory: str, mmap=True):
+        '''pattern databases saved for a problem with the same objects and goal
+
+        :param problem: AirCargoProblem
+        :param directory: str
+        :param mmap: bool (whether to memory-map the tables)
+        :return: PatternDatabaseHeuristic
+        '''
+        with open(os.path.join(directory, 'patterns.json')) as f:
+            saved = json.load(f)
+        if saved['problem'] not in (None, cls.signature(problem)):
+            raise ValueError('Pattern databases in {} were built for a different problem'.format(directory))
+        databases = [PatternDatabase.load(problem, pattern['cargos'], pattern['planes'], pattern['fly_cost'],
+                                          os.path.join(directory, pattern['file']), mmap)
+                     for pattern in saved['patterns']]
+        return cls(databases, saved['combine'])
+
+
+def check(problem, samples=200, walk=20, seed=0) -> int:
+    '''compare the default databases with goal_count_bound() on states of random walks
+
+    :param problem: AirCargoProblem
+    :param samples: int, number of sampled states
+    :param walk: int, maximum length of the random walks from the initial state
+    :param seed: int
+    :return: int, number of sampled states in which the databases exceed the closed form
+    :raises AssertionError: if the databases fall below the closed form in a state
+    '''
+    rng = random.Random(seed)
+    heuristic = PatternDatabaseHeuristic.build(problem)
+    exceeded = 0
+    for _ in range(samples):
+        bits = problem.initial_state_bits
+        for _ in range(rng.randrange(walk + 1)):
+            applicable = problem.applicable(bits)
+            if not applicable:
+                break
+            bits = problem.apply(bits, problem.action_masks[rng.choice(applicable)])
+        value = heuristic.value(bits)
+        bound = PatternDatabaseHeuristic.goal_count_bound(problem, bits)
+        assert value >= bound, 'h_pdb {} below the closed form {}'.format(value, bound)
+        exceeded += value > bound
+    return exceeded
+
+
+def main():
+    # benchmark imports my_air_cargo_problems, which imports this module
+    import benchmark
+
+    parser = argparse.ArgumentParser(description='Check the default pattern databases against the closed form')
+    parser.add_argument('problem', help='p1, p2, p3 or NxMxK for N cargos, M planes and K airports')
+    parser.add_argument('--seed', type=int, default=0, help='seed of a generated problem and of the walks')
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    problem = benchmark.make_problem(args.problem, args.seed)
+    exceeded = check(problem, args.samples, seed=args.seed)
+    print('h_pdb exceeds the closed form in {} of {} sampled states'.format(exceeded, args.samples))
+    if not exceeded:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+'''Parallel portfolio of search configurations for the air cargo problems.
+
+Several configurations of benchmark.CONFIGS are run at once, each in its own
+process, on the same problem, e.g.
+
+    python portfolio.py p3 --deadline 60 --best
+
+By default the first plan found is returned and the other workers are
+terminated. With best=True the portfolio waits until the deadline or until
+all workers are done and returns the shortest plan; it stops early when a
+configuration that always finds an optimal plan has finished.
+'''
+import argparse
+import multiprocessing
+import os
+import signal
+import timeit
+from multiprocessing.connection import wait
+
+import benchmark
+
+# A* with h_ignore_preconditions and h_pg_levelsum, greedy best-first and
+# breadth-first search
+PORTFOLIO = ('astar_ignore_preconditions', 'astar_levelsum', 'greedy_ff', 'breadth_first')
+
+# configurations whose plans are shortest plans (admissible heuristics)
+OPTIMAL = {'breadth_first', 'uniform_cost', 'astar_h1', 'astar_ignore_preconditions',
+           'astar_ignore_preconditions_cover', 'astar_maxlevel', 'astar_setlevel', 'astar_max',
+           'astar_pdb', 'compact_uniform_cost', 'compact_astar_ignore_preconditions',
+           'compact_astar_pdb'}
+
+# seconds to wait for a terminated worker before killing it
+JOIN_TIMEOUT = 1.
+
+
+def portfolio_worker(problem, config, connection):
+    '''run one configuration and send the plan as indices into problem.actions_list
+
+    :param problem: AirCargoProblem
+    :param config: str, key of benchmark.CONFIGS
+    :param connection: multiprocessing.Connection
+    '''
+    start = timeit.default_timer()
+    try:
+        node, instrumented = benchmark.solve(problem, config)
+        plan = None
+        if node is not None:
+            plan = [problem.action_index[action] for action in node.solution()]
+        report = {'outcome': 'done', 'solved': plan is not None, 'plan': plan,
+                  'expansions': instrumented.succs, 'goal_tests': instrumented.goal_tests,
+                  'new_nodes': instrumented.states}
+    except Exception as e:
+        report = {'outcome': 'error', 'solved': False, 'error': repr(e)}
+    report['time'] = timeit.default_timer() - start
+    connection.send(report)
+    connection.close()
+
+
+def stop(process):
+    '''terminate a worker and wait for it, killing it if it does not exit'''
+    if process.is_alive():
+        process.terminate()
+        process.join(JOIN_TIMEOUT)
+        # Process.kill() needs Python 3.7; terminate() already kills on Windows
+        if process.is_alive() and hasattr(signal, 'SIGKILL'):
+            os.kill(process.pid, signal.SIGKILL)
+    process.join()
+
+
+def solve_portfolio(problem, configs=PORTFOLIO, deadline=None, best=False, workers=None):
+    '''run search configurations in parallel worker processes
+
+    :param problem: AirCargoProblem
+    :param configs: iterable of str, keys of benchmark.CONFIGS
+    :param deadline: float or None
+        seconds after which all workers still running are terminated
+    :param best: bool
+        return the shortest plan found until the deadline instead of the first one
+    :param workers: int or None
+        maximum number of processes at once (default: all configurations); the
+        other configurations start when a worker finishes
+    :return: dict
+        'plan' (list of Action, or None), the 'config' that found it, the wall 'time'
+        until it was received and a report per configuration in 'reports'
+    '''
+    pending = list(configs)
+    workers = workers or len(pending)
+    running = {}
+    reports = {config: {'outcome': 'not started', 'solved': False} for config in pending}
+    result = {'plan': None, 'config': None, 'time': None, 'reports': reports}
+    start = timeit.default_timer()
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                config = pending.pop(0)
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=portfolio_worker,
+                                                  args=(problem, config, sender), daemon=True)
+                process.start()
+                sender.close()
+                running[receiver] = (config, process)
+                reports[config] = {'outcome': 'running', 'solved': False}
+
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - (timeit.default_timer() - start)
+                if timeout <= 0:
+                    break
+            ready = wait(list(running), timeout)
+            if not ready:
+                break
+
+            finished = False
+            for receiver in ready:
+                config, process = running.pop(receiver)
+                try:
+                    report = receiver.recv()
+                except EOFError:
+                    report = {'outcome': 'error', 'solved': False,
+                              'error': 'worker exited with code {}'.format(process.exitcode)}
+                receiver.close()
+                process.join()
+                reports[config] = report
+                if not report['solved']:
+                    continue
+                if result['plan'] is None or len(report['plan']) < len(result['plan']):
+                    result['plan'] = [problem.actions_list[ii] for ii in report['plan']]
+                    result['config'] = config
+                    result['time'] = timeit.default_timer() - start
+                if not best or config in OPTIMAL:
+                    finished = True
+            if finished:
+                break
+    finally:
+        for receiver, (config, process) in running.items():
+            stop(process)
+            receiver.close()
+            reports[config] = {'outcome': 'terminated', 'solved': False}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('problem', help='p1, p2, p3 or NxMxK for N cargos, M planes and K airports')
+    parser.add_argument('--seed', type=int, default=0, help='seed of a generated problem')
+    parser.add_argument('--configs', nargs='+', default=list(PORTFOLIO),
+                        help='search configurations: {}'.format(', '.join(sorted(benchmark.CONFIGS))))
+    parser.add_argument('--deadline', type=float, default=None, help='seconds')
+    parser.add_argument('--best', action='store_true', help='shortest plan until the deadline')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    problem = benchmark.make_problem(args.problem, args.seed)
+    result = solve_portfolio(problem, args.configs, args.deadline, args.best, args.workers)
+    for config, report in result['reports'].items():
+        print("{:>34}: {:11} {:>4} steps {:>9.3f}s".format(
+            config, report['outcome'],
+            len(report['plan']) if report.get('plan') is not None else '-', report.get('time') or 0.))
+    if result['plan'] is None:
+        print("No plan found")
+        return
+    print("Plan of length {} by {} after {:.3f}s:".format(
+        len(result['plan']), result['config'], result['time']))
+    for action in result['plan']:
+        print("{}{}".format(action.name, action.args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+'''Delete relaxation heuristics h_max, h_add and h_FF.
+
+The relaxed problem ignores delete effects and negative preconditions, so a
+fluent stays true once it has been reached. Costs of reaching the fluents are
+computed with a generalized Dijkstra search: every action keeps a counter of
+its preconditions that have not been reached yet and becomes applicable when
+the counter drops to zero. All actions cost 1.
+'''
+import heapq
+
+from my_planning_graph import bit_indices
+
+INF = float("inf")
+
+
+class RelaxedHeuristics():
+    '''
+    Relaxed reachability over the compiled actions of a problem.
+
+    Args:
+    ----------
+    action_masks : list of ActionMasks (or None for actions that can never be applied)
+        precompiled ground actions, see AirCargoProblem.compile_action
+
+    goal_mask : int or None
+        bit mask of the goal fluents; None if the goal can never be reached
+
+    num_fluents : int
+        number of fluents (bits) of the state encoding
+    '''
+
+    def __init__(self, action_masks: list, goal_mask, num_fluents: int):
+        self.goal_mask = goal_mask
+        self.goals = [] if goal_mask is None else bit_indices(goal_mask)
+        self.preconditions = []
+        self.add_effects = []
+        self.consumers = [[] for _ in range(num_fluents)]
+        self.unconditional = []
+        for masks in action_masks:
+            if masks is None:
+                continue
+            a_id = len(self.preconditions)
+            pre = bit_indices(masks.pre_pos)
+            self.preconditions.append(pre)
+            self.add_effects.append(bit_indices(masks.add))
+            for f in pre:
+                self.consumers[f].append(a_id)
+            if not pre:
+                self.unconditional.append(a_id)
+        self.pre_counts = [len(pre) for pre in self.preconditions]
+
+    def costs(self, state: int, combine):
+        '''relaxed cost of reaching the fluents from a state
+
+        The search stops as soon as the costs of all goal fluents are final.
+
+        :param state: int
+            bit mask of the fluents that hold
+        :param combine: function
+            max for h_max, sum for h_add; combines the costs of the preconditions
+        :return: (dict, dict)
+            cost of every reached fluent, and the action that reached each fluent
+            not in the state at that cost (its best supporter)
+        '''
+        cost = {f: 0 for f in bit_indices(state)}
+        supporter = {}
+        remaining = self.pre_counts[:]
+        queue = [(0, f) for f in cost]
+        for a_id in self.unconditional:
+            for f in self.add_effects[a_id]:
+                if cost.get(f, INF) > 1:
+                    cost[f] = 1
+                    supporter[f] = a_id
+                    queue.append((1, f))
+        heapq.heapify(queue)
+
+        open_goals = sum(1 for g in self.goals if g not in cost or cost[g] > 0)
+        closed = set()
+        while queue and open_goals:
+            c, f = heapq.heappop(queue)
+            if f in closed:
+                continue
+            closed.add(f)
+            if c > 0 and self.goal_mask >> f & 1:
+                open_goals -= 1
+            for a_id in self.consumers[f]:
+                remaining[a_id] -= 1
+                if remaining[a_id] == 0:
+                    a_cost = combine(cost[p] for p in self.preconditions[a_id]) + 1
+                    for e in self.add_effects[a_id]:
+                        if a_cost < cost.get(e, INF):
+                            cost[e] = a_cost
+                            supporter[e] = a_id
+                            heapq.heappush(queue, (a_cost, e))
+        return cost, supporter
+
+    def h_max(self, state: int):
+        '''cost of the most expensive goal fluent (admissible)
+
+        :param state: int
+        :return: int or inf
+        '''
+        if self.goal_mask is None:
+            return INF
+        cost, _ = self.costs(state, max)
+        return max((cost.get(g, INF) for g in self.goals), default=0)
+
+    def h_add(self, state: int):
+        '''sum of the costs of the goal fluents, assuming they are independent
+
+        :param state: int
+        :return: int or inf
+        '''
+        if self.goal_mask is None:
+            return INF
+        cost, _ = self.costs(state, sum)
+        return sum(cost.get(g, INF) for g in self.goals)
+
+    def relaxed_plan(self, state: int):
+        '''relaxed plan extracted backwards from the goals along the h_add best supporters
+
+        :param state: int
+        :return: set of action indices (into the applicable compiled actions), or None if
+            a goal is unreachable
+        '''
+        if self.goal_mask is None:
+            return None
+        cost, supporter = self.costs(state, sum)
+        plan = set()
+        stack = [g for g in self.goals if not state >> g & 1]
+        reached = set(stack)
+        while stack:
+            f = stack.pop()
+            if f not in supporter:
+                return None
+            a_id = supporter[f]
+            if a_id in plan:
+                continue
+            plan.add(a_id)
+            for p in self.preconditions[a_id]:
+                if not state >> p & 1 and p not in reached:
+                    reached.add(p)
+                    stack.append(p)
+        return plan
+
+    def h_ff(self, state: int):
+        '''number of actions of the relaxed plan (FF heuristic)
+
+        :param state: int
+        :return: int or inf
+        '''
+        plan = self.relaxed_plan(state)
+        if plan is None:
+            return INF
+        return len(plan)
@@ -0,0 +1,207 @@
+'''Symmetry reduction for air cargo problems.
+
+Cargos (or planes) are interchangeable if swapping their names maps the
+initial state, the goal and the state map of a problem onto themselves,
+e.g. two cargos that start at the same airport and have the same
+destination. Any permutation within the classes of interchangeable objects
+is a symmetry of the problem: states related by one have the same
+successors up to renaming and the same distance to the goal.
+
+AirCargoSymmetries maps every state to a canonical member of its class of
+symmetric states, and SymmetryReducedProblem searches over canonical states
+only, so duplicate detection collapses symmetric states. Its plans are
+lifted back to actions of the original problem by replaying them.
+'''
+from aimacode.search import Problem
+
+from my_planning_graph import bit_indices
+
+
+class AirCargoSymmetries():
+    '''
+    Interchangeable cargos and planes of an AirCargoProblem and the
+    canonicalization of its states.
+
+    Planes of a class are ordered by their airport and the classes of the
+    cargos they carry, then cargos of a class by their location (with the
+    planes already renamed). This canonical form is the same for all states
+    related by a symmetry. Airports are never renamed.
+
+    Args:
+    ----------
+    problem : AirCargoProblem
+    '''
+
+    def __init__(self, problem):
+        self.problem = problem
+        # (predicate, argument names) of every fluent of the state map, and the inverse
+        self.fluent_args = [(f.op, tuple(str(arg) for arg in f.args)) for f in problem.state_map]
+        self.fluent_ids = {args: ii for ii, args in enumerate(self.fluent_args)}
+        self.cargo_classes = self.interchangeable(problem.cargos)
+        self.plane_classes = self.interchangeable(problem.planes)
+        self.cargo_class = {c: ii for ii, members in enumerate(self.cargo_classes) for c in members}
+        self.action_ids = {(a.name, tuple(str(arg) for arg in a.args)): ii
+                           for ii, a in enumerate(problem.actions_list)}
+
+    @property
+    def trivial(self) -> bool:
+        '''whether no two objects are interchangeable'''
+        return all(len(members) == 1 for members in self.cargo_classes + self.plane_classes)
+
+    def rename(self, fluents, mapping: dict) -> set:
+        '''fluents (as (predicate, names) pairs) with their objects renamed
+
+        :param fluents: iterable of (str, tuple of str)
+        :param mapping: dict from old to new name; missing names are kept
+        :return: set of (str, tuple of str)
+        '''
+        return {(op, tuple(mapping.get(name, name) for name in names)) for op, names in fluents}
+
+    def is_symmetry(self, mapping: dict) -> bool:
+        '''test whether renaming objects preserves the initial state, goal and state map
+
+        :param mapping: dict from old to new name
+        :return: bool
+        '''
+        problem = self.problem
+        fluents = set(self.fluent_args)
+        initial = {self.fluent_args[ii] for ii in bit_indices(problem.initial_state_bits)}
+        goal = {(g.op, tuple(str(arg) for arg in g.args)) for g in problem.goal}
+        return all(self.rename(group, mapping) == group for group in (fluents, initial, goal))
+
+    def interchangeable(self, objects: list) -> list:
+        '''partition objects into classes of pairwise interchangeable objects
+
+        Interchangeability is an equivalence relation, so every object is only
+        compared to the first member of each class.
+
+        :param objects: list of str
+        :return: list of lists of str, in the order of `objects`
+        '''
+        classes = []
+        for obj in objects:
+            for members in classes:
+                if self.is_symmetry({obj: members[0], members[0]: obj}):
+                    members.append(obj)
+                    break
+            else:
+                classes.append([obj])
+        return classes
+
+    def canonicalize(self, bits: int):
+        '''canonical member of the class of symmetric states of a state
+
+        :param bits: int, state as bit mask
+        :return: (int, dict)
+            the canonical state as bit mask and the renaming of the objects that
+            maps the state onto it
+        '''
+        locations = {}
+        for ii in bit_indices(bits):
+            _, (obj, place) = self.fluent_args[ii]
+            locations.setdefault(obj, []).append(place)
+
+        loads = {}
+        for c, places in locations.items():
+            if c in self.cargo_class:
+                for place in places:
+                    loads.setdefault(place, []).append(self.cargo_class[c])
+
+        mapping = {}
+        for members in self.plane_classes:
+            if len(members) > 1:
+                ordered = sorted(members, key=lambda p: (sorted(locations.get(p, [])),
+                                                         sorted(loads.get(p, []))))
+                mapping.update(zip(ordered, members))
+        for members in self.cargo_classes:
+            if len(members) > 1:
+                ordered = sorted(members, key=lambda c: sorted(mapping.get(place, place)
+                                                               for place in locations.get(c, [])))
+                mapping.update(zip(ordered, members))
+
+        canonical = 0
+        for op, names in self.rename((self.fluent_args[ii] for ii in bit_indices(bits)), mapping):
+            canonical |= 1 << self.fluent_ids[(op, names)]
+        return canonical, mapping
+
+    def canonical(self, state):
+        '''canonical state in the encoding of `state`
+
+        :param state: str or int
+        :return: str or int
+        '''
+        bits, _ = self.canonicalize(self.problem.state_to_bits(state))
+        if isinstance(state, int):
+            return bits
+        return self.problem.bits_to_state(bits)
+
+    def lift_action(self, action, mapping: dict):
+        '''the action of the original state that corresponds to an action of its canonical state
+
+        :param action: Action
+        :param mapping: dict, renaming of the objects from the original to the canonical state
+        :return: Action of the problem's actions_list
+        '''
+        inverse = {new: old for old, new in mapping.items()}
+        args = tuple(inverse.get(str(arg), str(arg)) for arg in action.args)
+        return self.problem.actions_list[self.action_ids[(action.name, args)]]
+
+
+class SymmetryReducedProblem(Problem):
+    '''
+    Search problem over the canonical states of an AirCargoProblem.
+
+    Attributes that are not overridden (heuristics, state_map, action_masks...)
+    are those of the original problem; heuristics give the same value for
+    symmetric states since the goal is preserved by every symmetry. Plans of
+    searches on this problem are sequences of actions between canonical states;
+    lift_plan turns them into plans of the original problem.
+
+    Args:
+    ----------
+    problem : AirCargoProblem
+    '''
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.symmetries = AirCargoSymmetries(problem)
+        Problem.__init__(self, self.symmetries.canonical(problem.initial), goal=problem.goal)
+        self.initial_state_bits = self.symmetries.canonical(problem.initial_state_bits)
+
+    def __getattr__(self, attr):
+        if attr == 'problem':
+            raise AttributeError(attr)
+        return getattr(self.problem, attr)
+
+    def canonical_bits(self, bits: int) -> int:
+        '''canonical state of a bit mask state, see AirCargoSymmetries.canonicalize
+
+        :param bits: int
+        :return: int
+        '''
+        return self.symmetries.canonicalize(bits)[0]
+
+    def actions(self, state) -> list:
+        return self.problem.actions(state)
+
+    def result(self, state, action):
+        return self.symmetries.canonical(self.problem.result(state, action))
+
+    def goal_test(self, state) -> bool:
+        return self.problem.goal_test(state)
+
+    def lift_plan(self, plan: list) -> list:
+        '''replay a plan between canonical states from the initial state of the original problem
+
+        :param plan: list of Action, e.g. node.solution() of a search on this problem
+        :return: list of Action, a plan of the original problem
+        '''
+        problem = self.problem
+        state = problem.initial_state_bits
+        lifted = []
+        for action in plan:
+            _, mapping = self.symmetries.canonicalize(state)
+            action = self.symmetries.lift_action(action, mapping)
+            lifted.append(action)
+            state = problem.result(state, action)
+        return lifted